@@ -5,15 +5,26 @@ eventlet.monkey_patch()
 import os
 import logging
 import time
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
+import atexit
+import queue
+import heapq
+import hmac
+import threading
+from functools import lru_cache
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, g
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from datetime import datetime, timedelta
-import pytz
 import json
 import random
 import string
+import cachetools
+from sqlalchemy import and_, event, exists, func, inspect, or_, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import load_only, raiseload, selectinload
 from werkzeug.security import generate_password_hash, check_password_hash
-from models import db, Unit, Battalion, Company, Conduct, User, Session, ActivityLog
+from models import db, Unit, Battalion, Company, Conduct, User, Session, ActivityLog, check_missing_password
 
 # Configure logging for production
 logging.basicConfig(
@@ -23,11 +34,16 @@ logging.basicConfig(
         logging.StreamHandler()
     ]
 )
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # App events at INFO; per-request tracing stays at DEBUG
 
 # Create Flask app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
 
+# Password required to join a conduct as conducting body
+CONDUCTING_BODY_PASSWORD = os.environ.get("CONDUCTING_BODY_PASSWORD", "password")
+
 # Configure database with optimizations
 database_url = os.environ.get("DATABASE_URL")
 if not database_url:
@@ -44,16 +60,48 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 }
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Optional Redis for running more than one worker: Socket.IO events are relayed
+# between workers, conduct system status is shared and background checks take a
+# lock so only one worker runs each of them at a time. WebSocket clients that
+# fall back to polling need sticky sessions at the load balancer.
+redis_url = os.environ.get("REDIS_URL")
+redis_client = None
+release_lock_script = None
+if redis_url:
+    import redis
+    redis_client = redis.Redis.from_url(redis_url, decode_responses=True)
+    # Deletes a lock only if this worker still holds it, atomically, so a lock
+    # that expired and was taken by another worker is left alone
+    release_lock_script = redis_client.register_script(
+        "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+    )
+else:
+    print("REDIS_URL not found, running as a single worker")
+
 # Initialize extensions with production-ready settings
 socketio = SocketIO(app, async_mode='eventlet', ping_timeout=60, ping_interval=25, 
                     logger=False, engineio_logger=False, cors_allowed_origins="*",
-                    transports=['websocket', 'polling'])
+                    transports=['websocket', 'polling'], message_queue=redis_url)
 
 # Initialize database on startup
 db.init_app(app)
 
 # Initialize database immediately
+# Unique index the user_setup upsert conflicts on; init_db records whether it
+# exists so joins can fall back to select-then-insert when it could not be built
+USER_UPSERT_INDEX = 'uq_user_conduct_name'
+user_upsert_supported = False
+
+def find_duplicate_users():
+    """List (conduct_id, name, count) for users sharing a name within a conduct"""
+    return db.session.execute(
+        db.select(User.conduct_id, User.name, func.count().label('count'))
+        .group_by(User.conduct_id, User.name)
+        .having(func.count() > 1)
+    ).all()
+
 def init_db():
+    global user_upsert_supported
     with app.app_context():
         # Create tables if they don't exist (first time setup)
         try:
@@ -67,21 +115,19 @@ def init_db():
             # Start fresh transaction
             db.session.rollback()
             
-            # Check if most_stringent_zone column exists (PostgreSQL and SQLite compatible)
-            try:
-                db.session.execute(db.text("SELECT most_stringent_zone FROM \"user\" LIMIT 1"))
-                column_exists = True
-            except Exception:
-                column_exists = False
+            # Read the existing columns once from the database catalog
+            existing_columns = {c['name'] for c in inspect(db.engine).get_columns('user')}
             
-            if not column_exists:
-                print("Adding missing most_stringent_zone column to user table")
-                # Use proper PostgreSQL syntax for reserved keyword
-                db.session.execute(db.text('ALTER TABLE "user" ADD COLUMN most_stringent_zone VARCHAR(20)'))
-                db.session.commit()
-                print("Successfully added most_stringent_zone column")
-            else:
-                print("Database schema is up to date - most_stringent_zone column exists")
+            for column_name in ('most_stringent_zone', 'end_time_dt'):
+                if column_name not in existing_columns:
+                    print(f"Adding missing {column_name} column to user table")
+                    column_type = User.__table__.c[column_name].type.compile(dialect=db.engine.dialect)
+                    # Use proper PostgreSQL syntax for reserved keyword
+                    db.session.execute(db.text(f'ALTER TABLE "user" ADD COLUMN {column_name} {column_type}'))
+                    db.session.commit()
+                    print(f"Successfully added {column_name} column")
+                else:
+                    print(f"Database schema is up to date - {column_name} column exists")
                 
         except Exception as e:
             print(f"Schema check/update error: {e}")
@@ -93,6 +139,53 @@ def init_db():
             except Exception as create_error:
                 print(f"Error ensuring tables exist: {create_error}")
             
+        # Older databases may hold duplicate users per (conduct_id, name), which
+        # the unique index behind the join upsert cannot be built over. They are
+        # reported rather than merged, and the index is left for an operator to
+        # create once the duplicates have been cleaned up.
+        skipped_indexes = set()
+        try:
+            if USER_UPSERT_INDEX not in {ix['name'] for ix in inspect(db.engine).get_indexes('user')}:
+                duplicates = find_duplicate_users()
+                for duplicate in duplicates:
+                    logging.error(f"Conduct {duplicate.conduct_id} has {duplicate.count} users named {duplicate.name!r}")
+                if duplicates:
+                    skipped_indexes.add(USER_UPSERT_INDEX)
+                    logging.error(f"Not creating {USER_UPSERT_INDEX} while duplicate users exist")
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error checking for duplicate users: {e}")
+
+        # create_all() skips tables that already exist, so add any indexes
+        # declared on the models that are missing from older databases
+        try:
+            inspector = inspect(db.engine)
+            for table in db.metadata.sorted_tables:
+                existing_indexes = {ix['name'] for ix in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name not in existing_indexes and index.name not in skipped_indexes:
+                        # One failing index (e.g. a unique index over duplicate
+                        # rows) must not stop the others from being created.
+                        # IF NOT EXISTS covers expression indexes, which the
+                        # SQLite inspector does not report.
+                        try:
+                            with db.engine.begin() as conn:
+                                conn.execute(CreateIndex(index, if_not_exists=True))
+                        except Exception as e:
+                            print(f"Index creation error for {index.name}: {e}")
+        except Exception as e:
+            print(f"Index creation error: {e}")
+
+        # Joins only use ON CONFLICT when its unique index is really there
+        try:
+            user_indexes = {ix['name'] for ix in inspect(db.engine).get_indexes('user')}
+            user_upsert_supported = USER_UPSERT_INDEX in user_indexes
+        except Exception as e:
+            logging.error(f"Error checking user indexes: {e}")
+            user_upsert_supported = False
+        if not user_upsert_supported:
+            logging.error(f"Index {USER_UPSERT_INDEX} is missing; user joins fall back to select-then-insert")
+            
         # One-time migration: Set last_activity_at for existing conducts
         try:
             db.session.rollback()  # Start fresh
@@ -108,10 +201,33 @@ def init_db():
             print(f"Migration error: {e}")
             db.session.rollback()
 
-init_db()
+        # One-time migration: Set end_time_dt for users in the middle of a cycle
+        try:
+            db.session.rollback()  # Start fresh
+            
+            users_without_end = User.query.filter(
+                User.status.in_(['working', 'resting']),
+                User.end_time.isnot(None),
+                User.end_time_dt.is_(None)
+            ).all()
+            if users_without_end:
+                print(f"Migrating {len(users_without_end)} active users to add end_time_dt field")
+                now = sg_now()
+                for user in users_without_end:
+                    end_clock = datetime.strptime(user.end_time, '%H:%M:%S').time()
+                    end_time_dt = datetime.combine(now.date(), end_clock)
+                    # An end time far in the past is really tomorrow (midnight rollover)
+                    if now - end_time_dt > timedelta(hours=12):
+                        end_time_dt += timedelta(days=1)
+                    user.end_time_dt = end_time_dt
+                db.session.commit()
+                print("Migration completed successfully")
+        except Exception as e:
+            print(f"Migration error: {e}")
+            db.session.rollback()
 
 # Constants
-SG_TZ = pytz.timezone("Asia/Singapore")
+SG_OFFSET = timedelta(hours=8)  # Singapore is fixed UTC+8 with no DST
 WBGT_ZONES = {
     "white": {"work": 60, "rest": 15},
     "green": {"work": 45, "rest": 15},
@@ -122,6 +238,10 @@ WBGT_ZONES = {
     "cut-off": {"work": 0, "rest": 30}
 }
 
+# Work and rest durations (minutes) per zone, prebuilt for the hot paths
+ZONE_WORK = {zone: durations["work"] for zone, durations in WBGT_ZONES.items()}
+ZONE_REST = {zone: durations["rest"] for zone, durations in WBGT_ZONES.items()}
+
 # Zone stringency hierarchy (most stringent = highest index)
 ZONE_STRINGENCY = {
     "white": 0,
@@ -133,39 +253,42 @@ ZONE_STRINGENCY = {
     "test": 6  # Most stringent for testing purposes
 }
 
-# Global system status for each conduct
-conduct_system_status = {}
-
-# Simple cache for user data to reduce database queries
-user_cache = {}
-CACHE_TIMEOUT = 30  # seconds
+# Global system status for each conduct (kept in Redis instead when configured),
+# bounded and pruned when a conduct is deactivated
+MAX_TRACKED_CONDUCTS = 10000
+conduct_system_status = cachetools.LRUCache(maxsize=MAX_TRACKED_CONDUCTS)
 
 # Background task control
 background_task_started = False
 
-def get_cached_user(user_id):
-    """Get user from cache or database"""
-    current_time = datetime.now().timestamp()
-
-    if user_id in user_cache:
-        cached_data, timestamp = user_cache[user_id]
-        if current_time - timestamp < CACHE_TIMEOUT:
-            return cached_data
-
-    # Cache miss or expired, fetch from database
-    user = User.query.get(user_id)
-    if user:
-        user_cache[user_id] = (user, current_time)
+# Min-heap of pending cycle end times; the checker sleeps until the earliest one
+cycle_deadlines = []
+cycle_deadline_added = threading.Event()
+CYCLE_SWEEP_INTERVAL = 60  # seconds between fallback sweeps for cycles scheduled elsewhere
+CONDUCT_ACTIVITY_INTERVAL = 60  # seconds between inactive conduct checks
+BACKGROUND_LOCK_TTL = 30  # seconds before a crashed worker's check lock expires
 
-    return user
-
-def invalidate_user_cache(user_id):
-    """Remove user from cache when updated"""
-    if user_id in user_cache:
-        del user_cache[user_id]
+def dialect_insert(model):
+    """INSERT construct with ON CONFLICT support for the configured database"""
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql_insert(model)
+    return sqlite_insert(model)
 
 def get_conduct_system_status(conduct_id):
-    """Get system status for a specific conduct"""
+    """Get system status for a specific conduct, memoized for the current request"""
+    request_cache = g.setdefault('conduct_system_status', {})
+    if conduct_id not in request_cache:
+        request_cache[conduct_id] = load_conduct_system_status(conduct_id)
+    return request_cache[conduct_id]
+
+def load_conduct_system_status(conduct_id):
+    """Read system status for a conduct from Redis or the in-process store"""
+    if redis_client:
+        stored = redis_client.hgetall(f'sysstatus:{conduct_id}')
+        return {
+            "cut_off": stored.get("cut_off") == "1",
+            "cut_off_end_time": stored.get("cut_off_end_time") or None
+        }
     if conduct_id not in conduct_system_status:
         conduct_system_status[conduct_id] = {
             "cut_off": False,
@@ -173,11 +296,48 @@ def get_conduct_system_status(conduct_id):
         }
     return conduct_system_status[conduct_id]
 
+def save_conduct_system_status(conduct_id, system_status):
+    """Store a modified system status so every worker sees it"""
+    g.setdefault('conduct_system_status', {})[conduct_id] = system_status
+    if redis_client:
+        redis_client.hset(f'sysstatus:{conduct_id}', mapping={
+            "cut_off": "1" if system_status["cut_off"] else "0",
+            "cut_off_end_time": system_status["cut_off_end_time"] or ""
+        })
+    else:
+        conduct_system_status[conduct_id] = system_status
+
+def schedule_cycle_check(end_time_dt):
+    """Wake the background checker when a work or rest cycle ends"""
+    heapq.heappush(cycle_deadlines, end_time_dt)
+    cycle_deadline_added.set()
+
+def run_exclusive(lock_name, task, ttl=BACKGROUND_LOCK_TTL, release=True):
+    """Run a background check unless another worker holds its lock; returns whether it ran"""
+    if not redis_client:
+        task()
+        return True
+    key = f'bg:{lock_name}'
+    token = f'{os.getpid()}:{time.monotonic()}'
+    try:
+        if not redis_client.set(key, token, nx=True, ex=ttl):
+            return False
+    except Exception as e:
+        logging.error(f"Error acquiring background lock {key}: {e}")
+        return False
+    try:
+        task()
+    finally:
+        if release:
+            try:
+                release_lock_script(keys=[key], args=[token])
+            except Exception as e:
+                logging.error(f"Error releasing background lock {key}: {e}")
+    return True
+
 def sg_now():
     """Get current Singapore time as naive datetime"""
-    now = datetime.now(SG_TZ)
-    # Return naive datetime (without timezone info) in Singapore time
-    return now.replace(tzinfo=None, microsecond=0)
+    return (datetime.utcnow() + SG_OFFSET).replace(microsecond=0)
 
 def get_most_stringent_zone(current_zone, previous_most_stringent):
     """Determine the most stringent zone between current and previous"""
@@ -195,40 +355,92 @@ def get_most_stringent_zone(current_zone, previous_most_stringent):
 
 def get_rest_duration_for_most_stringent_zone(most_stringent_zone):
     """Get rest duration based on most stringent zone experienced during cycle"""
-    if not most_stringent_zone:
-        return 15  # Default to white zone rest
-    return WBGT_ZONES.get(most_stringent_zone, {}).get('rest', 15)
+    return ZONE_REST.get(most_stringent_zone, 15)  # Default to white zone rest
+
+@lru_cache(maxsize=8192)
+def conduct_room(conduct_id):
+    """Socket.IO room name for a conduct, built once per conduct"""
+    return f'conduct_{conduct_id}'
+
+@lru_cache(maxsize=8192)
+def user_room(username, conduct_id):
+    """Socket.IO room name for a single trainer in a conduct"""
+    return f'user_{username}_{conduct_id}'
+
+def serialize_user(user):
+    """Build the user_update payload for a user"""
+    return {
+        'user': user.name,
+        'status': user.status,
+        'zone': user.zone,
+        'start_time': user.start_time,
+        'end_time': user.end_time,
+        'work_completed': user.work_completed,
+        'pending_rest': user.pending_rest,
+        'role': user.role
+    }
 
 def emit_user_update(conduct_id, user):
     """Emit user update to all clients in conduct room"""
+    emit_user_payload(conduct_id, serialize_user(user))
+
+# Last user_update payload sent per conduct and username, used to skip repeats
+_last_user_state = cachetools.LRUCache(maxsize=MAX_TRACKED_CONDUCTS)
+
+def user_payload_changed(conduct_id, payload):
+    """Check a user payload against the last one sent and remember it"""
+    # With several workers another process may have emitted in between, so only
+    # skip unchanged updates when this process is the only emitter
+    if redis_client:
+        return True
+    last_payloads = _last_user_state.setdefault(conduct_id, {})
+    if last_payloads.get(payload['user']) == payload:
+        return False
+    last_payloads[payload['user']] = payload
+    return True
+
+def emit_user_payload(conduct_id, payload):
+    """Emit an already serialized user update to all clients in conduct room"""
+    if not user_payload_changed(conduct_id, payload):
+        return
     try:
-        socketio.emit('user_update', {
-            'user': user.name,
-            'status': user.status,
-            'zone': user.zone,
-            'start_time': user.start_time,
-            'end_time': user.end_time,
-            'work_completed': user.work_completed,
-            'pending_rest': user.pending_rest,
-            'role': user.role
-        }, room=f'conduct_{conduct_id}')
-        print(f"Emitted user update for {user.name} to conduct room {conduct_id}")
+        socketio.emit('user_update', payload, room=conduct_room(conduct_id))
+        logger.debug("Emitted user update for %s to conduct room %s", payload['user'], conduct_id)
     except Exception as e:
         logging.error(f"Error emitting user update: {e}")
 
+def emit_users_bulk_update(conduct_id, payloads):
+    """Emit several user updates to the conduct room as a single event"""
+    payloads = [payload for payload in payloads if user_payload_changed(conduct_id, payload)]
+    if not payloads:
+        return
+    try:
+        socketio.emit('users_bulk_update', {'users': payloads}, room=conduct_room(conduct_id))
+        logger.debug("Emitted bulk update for %s users to conduct room %s", len(payloads), conduct_id)
+    except Exception as e:
+        logging.error(f"Error emitting bulk user update: {e}")
+
 def emit_system_status_update(conduct_id, system_status):
     """Emit system status update to all clients in conduct room"""
     try:
-        socketio.emit('system_status_update', system_status, room=f'conduct_{conduct_id}')
-        print(f"Emitted system status update to conduct room {conduct_id}: {system_status}")
+        socketio.emit('system_status_update', system_status, room=conduct_room(conduct_id))
+        logger.debug("Emitted system status update to conduct room %s: %s", conduct_id, system_status)
     except Exception as e:
         logging.error(f"Error emitting system status update: {e}")
 
-def log_activity(conduct_id, username, action, zone=None, details=None):
-    """Log activity for a specific conduct"""
+def log_activity(conduct_id, username, action, zone=None, details=None, queued=True, now=None):
+    """Log activity for a specific conduct
+
+    With queued=True (the default) the log is handed to the background writer,
+    which inserts it with other pending logs shortly after and sends the
+    history update; nothing is written to the caller's session. With
+    queued=False the log is only added to the session; the caller commits it
+    with its own changes and is responsible for the history update.
+    Callers that already hold the current Singapore time can pass it as now.
+    """
     try:
         # Get current Singapore time
-        singapore_time = sg_now()
+        singapore_time = now or sg_now()
         
         # Enhanced details based on action type with join/rest times
         if action == 'user_joined' and not details:
@@ -244,9 +456,7 @@ def log_activity(conduct_id, username, action, zone=None, details=None):
         elif action == 'interface_reset' and not details:
             details = f"Trainer interface reset at {singapore_time.strftime('%I:%M:%S %p')}"
 
-        print(f"DEBUG: Creating activity log - conduct_id: {conduct_id}, username: {username}, action: {action}, zone: {zone}, details: {details}")
-
-        activity = ActivityLog(
+        values = dict(
             conduct_id=conduct_id,
             username=username,
             action=action,
@@ -254,48 +464,168 @@ def log_activity(conduct_id, username, action, zone=None, details=None):
             details=details,
             timestamp=singapore_time
         )
-        db.session.add(activity)
-        
-        # Flush to ensure the record is written to the database
-        db.session.flush()
-        print(f"DEBUG: Activity log flushed to database for {username}: {action}")
-        
-        db.session.commit()
-        print(f"DEBUG: Activity log committed to database for {username}: {action}")
 
-        # Emit to conduct room (unlimited history)
-        socketio.emit('history_update', {
-            'history': get_recent_history(conduct_id)
-        }, room=f'conduct_{conduct_id}')
-        print(f"DEBUG: History update emitted for conduct {conduct_id}")
+        if queued:
+            # Written off the request path by write_activity_logs
+            activity_log_queue.put(values)
+            return
+
+        db.session.add(ActivityLog(**values))
+        queue_history_entries(conduct_id, [values])
 
     except Exception as e:
-        print(f"ERROR logging activity: {e}")
         logging.error(f"Error logging activity: {e}")
         db.session.rollback()
 
-def get_recent_history(conduct_id, limit=None):
-    """Get activity history for a conduct (unlimited by default)"""
-    query = ActivityLog.query.filter_by(conduct_id=conduct_id)\
-                           .order_by(ActivityLog.timestamp.desc())
-    
-    # Only apply limit if specified
-    if limit:
-        query = query.limit(limit)
-    
-    logs = query.all()
+# Standalone activity logs waiting for the background writer
+activity_log_queue = queue.Queue()
+ACTIVITY_LOG_FLUSH_DELAY = 0.1  # seconds to gather logs into one insert
+ACTIVITY_LOG_BATCH_MAX = 500
 
-    return [{
-        'timestamp': log.timestamp.strftime('%Y-%m-%d %I:%M:%S %p'),
-        'username': log.username,
-        'action': log.action,
-        'zone': log.zone,
-        'details': log.details
-    } for log in logs]
+def insert_activity_logs(rows):
+    """Insert activity logs in one transaction and send their history updates; returns whether it committed"""
+    try:
+        db.session.execute(ActivityLog.__table__.insert(), rows)
+        for row in rows:
+            queue_history_entries(row['conduct_id'], [row])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error writing {len(rows)} activity logs: {e}")
+        return False
+    for conduct_id in {row['conduct_id'] for row in rows}:
+        schedule_history_update(conduct_id)
+    return True
 
-def show_work_complete_modal(username, zone):
+def flush_activity_logs(rows):
+    """Insert queued activity logs together, retrying row by row if the batch fails"""
+    with app.app_context():
+        if insert_activity_logs(rows) or len(rows) == 1:
+            return
+        # One bad row (e.g. for a conduct deleted meanwhile) must not drop the
+        # rest of the batch, so only the rows that fail on their own are lost
+        for row in rows:
+            if not insert_activity_logs([row]):
+                logging.error(f"Dropped activity log {row['action']} for {row['username']} "
+                              f"in conduct {row['conduct_id']}")
+
+def drain_activity_log_queue(limit=None):
+    """Take queued activity logs without waiting"""
+    rows = []
+    while limit is None or len(rows) < limit:
+        try:
+            rows.append(activity_log_queue.get_nowait())
+        except queue.Empty:
+            break
+    return rows
+
+def write_activity_logs():
+    """Background writer: wait for a log, gather the ones queued soon after, insert them together"""
+    while True:
+        rows = [activity_log_queue.get()]
+        socketio.sleep(ACTIVITY_LOG_FLUSH_DELAY)
+        rows.extend(drain_activity_log_queue(ACTIVITY_LOG_BATCH_MAX - 1))
+        flush_activity_logs(rows)
+
+@atexit.register
+def flush_pending_activity_logs():
+    """Write logs still queued when the process exits"""
+    rows = drain_activity_log_queue()
+    if rows:
+        flush_activity_logs(rows)
+
+def history_entry(log):
+    """Shape an activity log, given as a mapping of its columns, for the history table"""
+    return {
+        'timestamp': log['timestamp'].strftime('%Y-%m-%d %I:%M:%S %p'),
+        'username': log['username'],
+        'action': log['action'],
+        'zone': log['zone'],
+        'details': log['details']
+    }
+
+def queue_history_entries(conduct_id, logs):
+    """Hold new activity logs on the session until schedule_history_update sends them"""
+    queued = db.session.info.setdefault('history_entries', {})
+    # Keep the raw timestamps so _emit_history can order the entries
+    queued.setdefault(conduct_id, []).extend(dict(log) for log in logs)
+
+@event.listens_for(db.session, 'after_rollback')
+def _drop_queued_history(session):
+    """Logs rolled back with their transaction are never sent"""
+    session.info.pop('history_entries', None)
+
+# New history entries per conduct waiting for the queued history_update; further
+# logs before it runs are sent in the same emit
+_pending_history = {}
+
+def schedule_history_update(conduct_id):
+    """Queue the conduct's newly committed logs for a history_update on a background greenlet"""
+    entries = db.session.info.get('history_entries', {}).pop(conduct_id, None)
+    if not entries:
+        return
+    if conduct_id in _pending_history:
+        _pending_history[conduct_id].extend(entries)
+        return
+    _pending_history[conduct_id] = entries
+    socketio.start_background_task(_emit_history, conduct_id)
+
+def _emit_history(conduct_id):
+    """Send the new history entries for a conduct to the conduct room, newest first"""
+    # Logs are not queued in time order (e.g. rest completions carry their
+    # earlier end time, and background batches can land after a later log),
+    # so sort them the way get_recent_history does
+    logs = sorted(_pending_history.pop(conduct_id, [])[::-1], key=lambda log: log['timestamp'], reverse=True)
+    try:
+        socketio.emit('history_update', {
+            'entries': [history_entry(log) for log in logs],
+            'conduct_id': conduct_id
+        }, room=conduct_room(conduct_id))
+    except Exception as e:
+        logging.error(f"Error emitting history update: {e}")
+
+# Page loads within this many seconds of a logged join are treated as refreshes
+JOIN_LOG_WINDOW = 300
+
+def join_recently_logged(conduct_id, username):
+    """Check the session for a join logged by this browser in the last few minutes"""
+    last_logged = session.get(f'joined:{conduct_id}:{username}')
+    return last_logged is not None and time.time() - last_logged < JOIN_LOG_WINDOW
+
+def mark_join_logged(conduct_id, username):
+    """Remember in the session that a join was just logged"""
+    session[f'joined:{conduct_id}:{username}'] = time.time()
+
+def reactivate_conduct(conduct, reason):
+    """Mark an inactive conduct active again and log it in one commit"""
+    now = sg_now()
+    conduct.status = 'active'
+    conduct.last_activity_at = now  # Reset the 24-hour timer
+    log_activity(conduct.id, "SYSTEM", 'conduct_reactivated',
+                 details=f"Conduct reactivated by {reason} at {now.strftime('%Y-%m-%d %H:%M:%S')}",
+                 queued=False, now=now)
+    db.session.commit()
+    schedule_history_update(conduct.id)
+    logger.info("Conduct '%s' (PIN: %s) reactivated by %s", conduct.name, conduct.pin, reason)
+
+def get_recent_history(conduct_id, limit=200):
+    """Get the most recent activity history for a conduct"""
+    logs = db.session.query(
+        ActivityLog.timestamp,
+        ActivityLog.username,
+        ActivityLog.action,
+        ActivityLog.zone,
+        ActivityLog.details
+    ).filter_by(conduct_id=conduct_id)\
+     .order_by(ActivityLog.timestamp.desc())\
+     .limit(limit)\
+     .all()
+
+    return [history_entry(log._mapping) for log in logs]
+
+def show_work_complete_modal(username, zone, conduct_id):
     """Send work complete modal notification to specific user"""
-    rest_duration = WBGT_ZONES.get(zone, {}).get('rest', 15)
+    rest_duration = ZONE_REST.get(zone, 15)
 
     # Create notification data
     notification_data = {
@@ -307,11 +637,19 @@ def show_work_complete_modal(username, zone):
     }
 
     # Emit to specific user
-    socketio.emit('show_work_complete_modal', notification_data)
+    socketio.emit('show_work_complete_modal', notification_data, room=user_room(username, conduct_id))
 
-    print(f"Work complete modal shown for {username} in {zone} zone")
+    logger.debug("Work complete modal shown for %s in %s zone", username, zone)
     return True
 
+def forget_conduct_state(conduct_ids):
+    """Drop system status and last-emitted user state for finished conducts"""
+    for conduct_id in conduct_ids:
+        conduct_system_status.pop(conduct_id, None)
+        _last_user_state.pop(conduct_id, None)
+        if redis_client:
+            redis_client.delete(f'sysstatus:{conduct_id}')
+
 def check_conduct_activity():
     """Background task to check for conducts that should be deactivated after 24 hours with no users"""
     with app.app_context():
@@ -321,36 +659,45 @@ def check_conduct_activity():
             twenty_four_hours_ago = now - timedelta(hours=24)
             
             # Find active conducts with no activity for more than 24 hours
-            old_conducts = Conduct.query.filter(
+            # and no currently active users, in a single query
+            has_active_users = exists().where(
+                User.conduct_id == Conduct.id,
+                User.status.in_(['working', 'resting'])
+            )
+            stale_conducts = db.session.query(Conduct.id, Conduct.name, Conduct.pin).filter(
                 Conduct.status == 'active',
-                Conduct.last_activity_at < twenty_four_hours_ago
+                Conduct.last_activity_at < twenty_four_hours_ago,
+                ~has_active_users
             ).all()
             
-            for conduct in old_conducts:
-                # Check if there are any currently active users in this conduct
-                active_user_count = User.query.filter_by(conduct_id=conduct.id).filter(
-                    User.status.in_(['working', 'resting'])
-                ).count()
-                
-                if active_user_count == 0:
-                    # No active users in this conduct for 24 hours - deactivate it
-                    conduct.status = 'inactive'
-                    print(f"Conduct '{conduct.name}' (PIN: {conduct.pin}) automatically deactivated after 24 hours with no active users")
-                    
-                    # Log the deactivation activity if there's activity logging
-                    try:
-                        log_activity(conduct.id, "SYSTEM", 'conduct_deactivated', 
-                                   details=f"Conduct automatically deactivated after 24 hours with no active users at {now.strftime('%Y-%m-%d %H:%M:%S')}")
-                    except:
-                        # If logging fails, continue with deactivation
-                        pass
+            if not stale_conducts:
+                return
+            
+            # No active users in these conducts for 24 hours - deactivate them
+            db.session.execute(
+                update(Conduct)
+                .where(Conduct.id.in_([conduct.id for conduct in stale_conducts]))
+                .values(status='inactive')
+            )
+            
+            for conduct in stale_conducts:
+                logger.info("Conduct '%s' (PIN: %s) automatically deactivated after 24 hours with no active users",
+                            conduct.name, conduct.pin)
+                log_activity(conduct.id, "SYSTEM", 'conduct_deactivated', 
+                           details=f"Conduct automatically deactivated after 24 hours with no active users at {now.strftime('%Y-%m-%d %H:%M:%S')}",
+                           queued=False, now=now)
             
             # Commit all changes
-            if old_conducts:
-                db.session.commit()
+            db.session.commit()
+
+            # Send each conduct's deactivation log to monitors still watching it
+            for conduct in stale_conducts:
+                schedule_history_update(conduct.id)
+
+            # Drop in-process state held for the deactivated conducts
+            forget_conduct_state([conduct.id for conduct in stale_conducts])
                 
         except Exception as e:
-            print(f"Error in conduct activity check: {e}")
             logging.error(f"Error in conduct activity check: {e}")
             db.session.rollback()
 
@@ -362,237 +709,128 @@ def check_user_cycles():
             now = sg_now()
             current_time_str = now.strftime('%H:%M:%S')
 
-            # Find users whose work cycles should have ended
-            working_users = User.query.filter_by(status='working').all()
-
-            for user in working_users:
-                if user.end_time:
-                    # Parse end time
-                    end_time_parts = user.end_time.split(':')
-                    end_time = now.replace(
-                        hour=int(end_time_parts[0]),
-                        minute=int(end_time_parts[1]),
-                        second=int(end_time_parts[2]) if len(end_time_parts) > 2 else 0,
-                        microsecond=0
-                    )
-                    
-                    # Handle midnight rollover: if end time is earlier than start time,
-                    # it means the end time is on the next day
-                    if user.start_time:
-                        start_time_parts = user.start_time.split(':')
-                        start_hour = int(start_time_parts[0])
-                        end_hour = int(end_time_parts[0])
-                        
-                        # If end time is significantly earlier than start time, assume next day
-                        if end_hour < start_hour and (start_hour - end_hour) > 12:
-                            end_time = end_time + timedelta(days=1)
-                            if not hasattr(user, '_midnight_logged') or not user._midnight_logged:
-                                print(f"Server: Midnight rollover detected for working user {user.name}: {user.end_time} moved to next day")
-                                user._midnight_logged = True
-
-                    # If work cycle has ended
-                    if now >= end_time and not user.work_completed:
-                        print(f"Work cycle completed for user {user.name} in zone {user.zone}")
-
-                        # Mark work as completed and pending rest
-                        user.work_completed = True
-                        user.pending_rest = True
-                        user.status = 'idle'  # Change status but keep other data for notification
-
-                        db.session.commit()
-                        invalidate_user_cache(user.id)
-
-                        # Log completion
-                        log_activity(user.conduct_id, user.name, 'completed_work', user.zone, 
-                                    f"Work cycle completed automatically at {current_time_str}")
-
-                        # Emit user update
-                        emit_user_update(user.conduct_id, user)
-
-                        # Show work complete modal
-                        show_work_complete_modal(user.name, user.zone)
-
-                        # Also emit work cycle completed event for enhanced notification handling
-                        socketio.emit('work_cycle_completed', {
-                            'username': user.name,
-                            'zone': user.zone,
-                            'rest_time': WBGT_ZONES.get(user.zone, {}).get('rest', 15),
-                            'action': 'work_cycle_completed'
-                        }, room=f'conduct_{user.conduct_id}')
-
-                        print(f"Work completion notification sent for {user.name}")
-
-            # Check for resting users
-            resting_users = User.query.filter_by(status='resting').all()
-
-            for user in resting_users:
-                if user.end_time:
-                    # Parse end time
-                    end_time_parts = user.end_time.split(':')
-                    end_time = now.replace(
-                        hour=int(end_time_parts[0]),
-                        minute=int(end_time_parts[1]),
-                        second=int(end_time_parts[2]) if len(end_time_parts) > 2 else 0,
-                        microsecond=0
-                    )
-                    
-                    # Handle midnight rollover: if end time is earlier than start time,
-                    # it means the end time is on the next day
-                    if user.start_time:
-                        start_time_parts = user.start_time.split(':')
-                        start_hour = int(start_time_parts[0])
-                        end_hour = int(end_time_parts[0])
-                        
-                        # If end time is significantly earlier than start time, assume next day
-                        if end_hour < start_hour and (start_hour - end_hour) > 12:
-                            end_time = end_time + timedelta(days=1)
-                            print(f"Server: Midnight rollover detected for resting user {user.name}: {user.end_time} moved to next day")
-
-                    # Calculate exact time difference
-                    time_diff = (end_time - now).total_seconds()
-                    
-                    # If rest cycle has ended (use exact timing)
-                    if time_diff <= 0:
-                        print(f"Rest cycle completed for user {user.name} (time diff: {time_diff:.1f}s)")
-                        print(f"TIMING DEBUG: Completion - Start: {user.start_time}, End: {user.end_time}, Actual: {now.strftime('%H:%M:%S')}")
-
-                        # Store zone and conduct info before clearing for logging
-                        completed_zone = user.zone
-                        conduct_id = user.conduct_id
-                        user_name = user.name
-                        
-                        # Use the intended end time for accurate logging (the stored end_time)
-                        intended_end_time = user.end_time  # Use the stored end time string directly
-
-                        # CRITICAL FIX: Log completion BEFORE resetting user data
-                        # This ensures the zone information is available for logging
-                        try:
-                            # RENDER PRODUCTION FIX: Create activity log in separate transaction
-                            activity_log = ActivityLog(
-                                conduct_id=conduct_id,
-                                username=user_name,
-                                action='completed_rest',
-                                zone=completed_zone,
-                                details=f"Rest cycle completed automatically at {intended_end_time}",
-                                timestamp=end_time  # Use calculated end_time for precise duration
-                            )
-                            
-                            db.session.add(activity_log)
-                            db.session.flush()  # Flush to get the log ID
-                            print(f"RENDER DEBUG: Activity log created for {user_name}: completed_rest in {completed_zone}")
-                            
-                            # Reset user data - ENSURE all flags are cleared
-                            user.status = 'idle'
-                            user.zone = None
-                            user.start_time = None
-                            user.end_time = None
-                            user.work_completed = False
-                            user.pending_rest = False
-                            user.most_stringent_zone = None  # Reset stringent zone tracker
-                            
-                            # Commit BOTH activity log and user changes together
-                            db.session.commit()
-                            print(f"RENDER DEBUG: Combined database commit successful for {user_name} rest completion")
-                            
-                            # CRITICAL: Add a small delay to ensure database transaction is fully completed
-                            import time
-                            time.sleep(0.2)  # 200ms delay to ensure database consistency on Render
-                            
-                            # Verify the activity log was actually saved
-                            verification_log = ActivityLog.query.filter_by(
-                                conduct_id=conduct_id,
-                                username=user_name,
-                                action='completed_rest'
-                            ).order_by(ActivityLog.timestamp.desc()).first()
-                            
-                            if verification_log:
-                                print(f"RENDER DEBUG: Activity log verified in database - ID: {verification_log.id}, Time: {verification_log.timestamp}")
-                            else:
-                                print(f"RENDER DEBUG: WARNING - Activity log not found in database after commit")
-                            
-                        except Exception as combined_error:
-                            print(f"RENDER DEBUG: Error in combined transaction: {combined_error}")
-                            db.session.rollback()
-                            
-                            # Fallback: Try logging activity separately
-                            try:
-                                fallback_log = ActivityLog(
-                                    conduct_id=conduct_id,
-                                    username=user_name,
-                                    action='completed_rest',
-                                    zone=completed_zone,
-                                    details=f"Rest cycle completed automatically at {intended_end_time} (fallback)",
-                                    timestamp=end_time  # Use intended end time for accuracy
-                                )
-                                db.session.add(fallback_log)
-                                db.session.commit()
-                                print(f"RENDER DEBUG: Fallback activity log successful for {user_name}")
-                                
-                                # Now update user separately
-                                user.status = 'idle'
-                                user.zone = None
-                                user.start_time = None
-                                user.end_time = None
-                                user.work_completed = False
-                                user.pending_rest = False
-                                user.most_stringent_zone = None  # Reset stringent zone tracker
-                                db.session.commit()
-                                print(f"RENDER DEBUG: Fallback user update successful for {user_name}")
-                                
-                            except Exception as fallback_error:
-                                print(f"RENDER DEBUG: Fallback also failed: {fallback_error}")
-                                db.session.rollback()
-
-                        invalidate_user_cache(user.id)
-
-                        # Emit user update
-                        emit_user_update(conduct_id, user)
-
-                        # Emit specific event for zone button re-enabling
-                        socketio.emit('rest_cycle_completed', {
-                            'user': user_name,
-                            'zone': completed_zone,
-                            'action': 'rest_cycle_completed'
-                        }, room=f'conduct_{conduct_id}')
-
-                        # Force immediate history refresh for monitors - ENHANCED VERSION
-                        try:
-                            # Small delay before emitting to ensure database is fully consistent
-                            time.sleep(0.1)
-                            
-                            updated_history = get_recent_history(conduct_id)
-                            
-                            # Emit history update with complete data
-                            socketio.emit('history_update', {
-                                'history': updated_history,
-                                'conduct_id': conduct_id,
-                                'trigger': 'rest_completion'
-                            }, room=f'conduct_{conduct_id}')
-                            print(f"RENDER DEBUG: History update emitted with {len(updated_history)} entries")
-                            
-                            # Also emit a global history refresh to ensure all monitors update
-                            socketio.emit('force_history_refresh', {
-                                'conduct_id': conduct_id,
-                                'message': f'{user_name} completed rest cycle in {completed_zone} zone',
-                                'action': 'rest_completed'
-                            }, room=f'conduct_{conduct_id}')
-                            print(f"RENDER DEBUG: Force history refresh emitted for {user_name}")
-                            
-                        except Exception as history_error:
-                            print(f"RENDER DEBUG: Error emitting history update: {history_error}")
-                            # Fallback: Try again with simpler data
-                            try:
-                                socketio.emit('force_history_refresh', {
-                                    'conduct_id': conduct_id,
-                                    'fallback': True
-                                }, room=f'conduct_{conduct_id}')
-                            except:
-                                pass
-
-                        print(f"Rest completion processed successfully for {user_name} in zone {completed_zone}")
+            # Find working and resting users whose cycles have ended
+            due_users = User.query.filter(
+                User.status.in_(['working', 'resting']),
+                User.end_time_dt <= now
+            ).all()
+
+            completed_work = []
+            completed_rest = []
+
+            for user in due_users:
+                if user.status == 'working':
+                    if not user.work_completed:
+                        completed_work.append(user)
+                else:
+                    logger.debug("Rest cycle completed for user %s - Start: %s, End: %s, Actual: %s",
+                                 user.name, user.start_time, user.end_time, now)
+                    completed_rest.append(user)
+
+            if not completed_work and not completed_rest:
+                return
+
+            # Build all activity logs up front. Rest completions are logged with
+            # the intended end time (the stored end_time) for accurate durations.
+            log_rows = [dict(
+                conduct_id=user.conduct_id,
+                username=user.name,
+                action='completed_work',
+                zone=user.zone,
+                details=f"Work cycle completed automatically at {current_time_str}",
+                timestamp=now
+            ) for user in completed_work]
+            log_rows.extend(dict(
+                conduct_id=user.conduct_id,
+                username=user.name,
+                action='completed_rest',
+                zone=user.zone,
+                details=f"Rest cycle completed automatically at {user.end_time}",
+                timestamp=user.end_time_dt
+            ) for user in completed_rest)
+
+            # Store zone and conduct info before clearing, for the emits below
+            rest_info = [(user.conduct_id, user.name, user.zone) for user in completed_rest]
+
+            # Mark work as completed and pending rest; change status but keep
+            # other data for notification
+            if completed_work:
+                db.session.execute(
+                    update(User)
+                    .where(User.id.in_([user.id for user in completed_work]))
+                    .values(work_completed=True, pending_rest=True, status='idle')
+                )
+
+            # Reset rested users - ENSURE all flags are cleared
+            if completed_rest:
+                db.session.execute(
+                    update(User)
+                    .where(User.id.in_([user.id for user in completed_rest]))
+                    .values(status='idle', zone=None, start_time=None, end_time=None, end_time_dt=None,
+                            work_completed=False, pending_rest=False, most_stringent_zone=None)
+                )
+
+            # The bulk updates are synchronized into the loaded users, so build
+            # the emit payloads now; commit expires them.
+            work_info = [(user.conduct_id, user.name, user.zone, serialize_user(user))
+                         for user in completed_work]
+            rest_payloads = [serialize_user(user) for user in completed_rest]
+
+            # Commit activity logs and user changes together
+            if log_rows:
+                # Core executemany insert, skipping the ORM unit of work
+                db.session.execute(ActivityLog.__table__.insert(), log_rows)
+                for row in log_rows:
+                    queue_history_entries(row['conduct_id'], [row])
+            db.session.commit()
+
+            # Conducts whose history changed this tick; each gets a single history update
+            dirty_conducts = set()
+
+            for conduct_id, user_name, zone, payload in work_info:
+                logger.debug("Work cycle completed for user %s in zone %s", user_name, zone)
+                dirty_conducts.add(conduct_id)
+
+                # Emit user update
+                emit_user_payload(conduct_id, payload)
+
+                # Show work complete modal
+                show_work_complete_modal(user_name, zone, conduct_id)
+
+                # Also emit work cycle completed event for enhanced notification handling
+                socketio.emit('work_cycle_completed', {
+                    'username': user_name,
+                    'zone': zone,
+                    'rest_time': ZONE_REST.get(zone, 15),
+                    'action': 'work_cycle_completed'
+                }, room=user_room(user_name, conduct_id))
+
+                logger.debug("Work completion notification sent for %s", user_name)
+
+            for (conduct_id, user_name, completed_zone), payload in zip(rest_info, rest_payloads):
+                dirty_conducts.add(conduct_id)
+
+                # Emit user update
+                emit_user_payload(conduct_id, payload)
+
+                # Emit specific event for zone button re-enabling
+                socketio.emit('rest_cycle_completed', {
+                    'user': user_name,
+                    'zone': completed_zone,
+                    'action': 'rest_cycle_completed'
+                }, room=conduct_room(conduct_id))
+
+                logger.debug("Rest completion processed successfully for %s in zone %s", user_name, completed_zone)
+
+            # Refresh history for monitors once per affected conduct
+            for conduct_id in dirty_conducts:
+                schedule_history_update(conduct_id)
 
         except Exception as e:
             logging.error(f"Error in work completion check: {e}")
+            db.session.rollback()
+
+init_db()
 
 # Routes (keeping all existing routes unchanged...)
 
@@ -616,20 +854,23 @@ def create_conduct_new():
             return render_template('create_conduct_new.html')
 
         try:
-            # Check if battalion exists (case insensitive)
-            battalion = Battalion.query.filter(Battalion.name.ilike(battalion_name)).first()
-            if not battalion:
+            # Look up the battalion and the company within it (case insensitive)
+            # in one query; the company is None when it does not exist yet
+            match = db.session.query(Battalion, Company).outerjoin(
+                Company,
+                and_(Company.battalion_id == Battalion.id,
+                     func.lower(Company.name) == func.lower(company_name))
+            ).filter(func.lower(Battalion.name) == func.lower(battalion_name)).first()
+
+            if match:
+                battalion, company = match
+            else:
                 # Create new battalion
                 battalion = Battalion(name=battalion_name)
                 battalion.set_password('test123')  # Default password for HQ access
                 db.session.add(battalion)
                 db.session.flush()  # Get battalion ID
-
-            # Check if company exists in this battalion (case insensitive)
-            company = Company.query.filter(
-                Company.battalion_id == battalion.id,
-                Company.name.ilike(company_name)
-            ).first()
+                company = None
 
             if company:
                 # Verify company password
@@ -680,8 +921,10 @@ def view_conducts_new():
                 return render_template('view_conducts_new.html')
             
             try:
-                battalion = Battalion.query.filter(Battalion.name.ilike(battalion_name)).first()
-                if battalion and battalion.check_password(battalion_password):
+                battalion = Battalion.query.filter(func.lower(Battalion.name) == func.lower(battalion_name)).first()
+                authenticated = (battalion.check_password(battalion_password) if battalion
+                                 else check_missing_password(battalion_password))
+                if authenticated:
                     return redirect(url_for('battalion_overview', battalion_id=battalion.id))
                 else:
                     flash('Invalid battalion name or password.', 'error')
@@ -702,22 +945,19 @@ def view_conducts_new():
                 return render_template('view_conducts_new.html')
             
             try:
-                # First find the battalion
-                battalion = Battalion.query.filter(Battalion.name.ilike(company_battalion_name)).first()
-                if not battalion:
-                    flash('Battalion not found. Please check the battalion name.', 'error')
-                    return render_template('view_conducts_new.html')
-                
-                # Then find the company within that battalion
-                company = Company.query.filter(
-                    Company.battalion_id == battalion.id,
-                    Company.name.ilike(company_name)
+                # Find the company within the battalion in one query
+                company = Company.query.join(Battalion).filter(
+                    func.lower(Battalion.name) == func.lower(company_battalion_name),
+                    func.lower(Company.name) == func.lower(company_name)
                 ).first()
                 
-                if company and company.check_password(company_password):
+                # Unknown battalion or company get the same message as a wrong password
+                authenticated = (company.check_password(company_password) if company
+                                 else check_missing_password(company_password))
+                if authenticated:
                     return redirect(url_for('company_conducts', company_id=company.id))
                 else:
-                    flash('Invalid company name or password for the specified battalion.', 'error')
+                    flash('Invalid battalion name, company name or password.', 'error')
                     return render_template('view_conducts_new.html')
                     
             except Exception as e:
@@ -732,22 +972,33 @@ def view_conducts_new():
 @app.route('/battalion_overview/<int:battalion_id>')
 def battalion_overview(battalion_id):
     try:
-        battalion = Battalion.query.get_or_404(battalion_id)
-        companies = Company.query.filter_by(battalion_id=battalion_id).order_by(Company.name).all()
-        
-        # Calculate statistics
-        total_conducts = 0
-        active_conducts = 0
+        battalion = db.get_or_404(Battalion, battalion_id)
+        # Load every company's conducts in one extra query instead of one per company
+        companies = Company.query.options(selectinload(Company.conducts)).filter_by(
+            battalion_id=battalion_id).order_by(Company.name).all()
         
-        for company in companies:
-            total_conducts += len(company.conducts)
-            active_conducts += len([c for c in company.conducts if c.status == 'active'])
+        # Calculate statistics from the already loaded conducts (the template
+        # lists them all, so a separate SQL count would be an extra round-trip)
+        total_conducts = sum(len(company.conducts) for company in companies)
+        active_conducts = sum(1 for company in companies
+                              for conduct in company.conducts if conduct.status == 'active')
+
+        # Participants per conduct in one grouped query instead of loading each conduct's users
+        participant_counts = dict(
+            db.session.query(User.conduct_id, func.count(User.id))
+            .join(Conduct, User.conduct_id == Conduct.id)
+            .join(Company, Conduct.company_id == Company.id)
+            .filter(Company.battalion_id == battalion_id)
+            .group_by(User.conduct_id)
+            .all()
+        )
 
         return render_template('battalion_overview.html',
                              battalion=battalion,
                              company_data=companies,
                              total_conducts=total_conducts,
-                             active_conducts=active_conducts)
+                             active_conducts=active_conducts,
+                             participant_counts=participant_counts)
     except Exception as e:
         flash(f'Error loading battalion overview: {str(e)}', 'error')
         return redirect(url_for('index'))
@@ -755,7 +1006,7 @@ def battalion_overview(battalion_id):
 @app.route('/company_conducts/<int:company_id>')
 def company_conducts(company_id):
     try:
-        company = Company.query.get_or_404(company_id)
+        company = db.get_or_404(Company, company_id)
         conducts = Conduct.query.filter_by(company_id=company_id).order_by(Conduct.created_at.desc()).all()
         
         return render_template('company_conducts.html',
@@ -770,7 +1021,7 @@ def delete_conducts(battalion_id):
     """Delete selected conducts - only accessible by battalion accounts"""
     try:
         # Verify battalion access
-        battalion = Battalion.query.get_or_404(battalion_id)
+        battalion = db.get_or_404(Battalion, battalion_id)
         
         # Get list of conduct IDs to delete
         conduct_ids = request.form.getlist('conduct_ids')
@@ -785,39 +1036,36 @@ def delete_conducts(battalion_id):
             flash('Invalid conduct IDs provided.', 'error')
             return redirect(url_for('battalion_overview', battalion_id=battalion_id))
         
-        # Verify all conducts belong to companies in this battalion
-        conducts_to_delete = []
+        # Verify all conducts belong to companies in this battalion (single query)
+        found = {row.id: row for row in db.session.query(
+            Conduct.id, Conduct.name, Company.battalion_id
+        ).join(Company).filter(Conduct.id.in_(conduct_ids)).all()}
+        
         for conduct_id in conduct_ids:
-            conduct = Conduct.query.get(conduct_id)
+            conduct = found.get(conduct_id)
             if not conduct:
                 flash(f'Conduct ID {conduct_id} not found.', 'error')
                 return redirect(url_for('battalion_overview', battalion_id=battalion_id))
             
             # Check if conduct belongs to a company in this battalion
-            if conduct.company.battalion_id != battalion_id:
+            if conduct.battalion_id != battalion_id:
                 flash(f'Conduct "{conduct.name}" does not belong to this battalion.', 'error')
                 return redirect(url_for('battalion_overview', battalion_id=battalion_id))
-            
-            conducts_to_delete.append(conduct)
         
-        # Delete associated records first (sessions, users, activity logs)
-        deleted_count = 0
-        for conduct in conducts_to_delete:
-            # Delete sessions first
-            Session.query.filter_by(conduct_id=conduct.id).delete()
-            
-            # Delete activity logs
-            ActivityLog.query.filter_by(conduct_id=conduct.id).delete()
-            
-            # Delete users
-            User.query.filter_by(conduct_id=conduct.id).delete()
-            
-            # Delete the conduct itself
-            db.session.delete(conduct)
-            deleted_count += 1
+        # Delete associated records first (sessions, activity logs, users), one
+        # statement per table. SQLite does not enforce the ON DELETE CASCADE
+        # foreign keys and older Postgres databases were created without them.
+        valid_ids = list(found)
+        Session.query.filter(Session.conduct_id.in_(valid_ids)).delete(synchronize_session=False)
+        ActivityLog.query.filter(ActivityLog.conduct_id.in_(valid_ids)).delete(synchronize_session=False)
+        User.query.filter(User.conduct_id.in_(valid_ids)).delete(synchronize_session=False)
+        
+        # Delete the conducts themselves
+        deleted_count = Conduct.query.filter(Conduct.id.in_(valid_ids)).delete(synchronize_session=False)
         
         # Commit all deletions
         db.session.commit()
+        forget_conduct_state(valid_ids)
         
         flash(f'Successfully deleted {deleted_count} conduct(s).', 'success')
         return redirect(url_for('battalion_overview', battalion_id=battalion_id))
@@ -887,7 +1135,8 @@ def view_conducts():
 
         unit = Unit.query.filter_by(name=unit_name).first()
 
-        if not unit or not unit.check_password(unit_password):
+        authenticated = unit.check_password(unit_password) if unit else check_missing_password(unit_password)
+        if not authenticated:
             flash('Invalid unit name or password', 'error')
             return render_template('view_conducts.html')
 
@@ -898,7 +1147,7 @@ def view_conducts():
 @app.route('/conduct_list/<int:unit_id>')
 def conduct_list(unit_id):
     """Page 3: Conduct List Dashboard"""
-    unit = Unit.query.get_or_404(unit_id)
+    unit = db.get_or_404(Unit, unit_id)
     conducts = Conduct.query.filter_by(unit_id=unit_id).order_by(Conduct.created_at.desc()).all()
 
     return render_template('conduct_list.html', unit=unit, conducts=conducts)
@@ -921,17 +1170,7 @@ def join_conduct():
             
         # If conduct is inactive, reactivate it when someone joins
         if conduct.status == 'inactive':
-            conduct.status = 'active'
-            conduct.last_activity_at = sg_now()  # Reset the 24-hour timer
-            db.session.commit()
-            print(f"Conduct '{conduct.name}' (PIN: {conduct.pin}) reactivated by user joining")
-            
-            # Log the reactivation
-            try:
-                log_activity(conduct.id, "SYSTEM", 'conduct_reactivated', 
-                           details=f"Conduct reactivated by user joining at {sg_now().strftime('%Y-%m-%d %H:%M:%S')}")
-            except:
-                pass
+            reactivate_conduct(conduct, "user joining")
 
         return redirect(url_for('user_setup', conduct_id=conduct.id))
 
@@ -940,21 +1179,11 @@ def join_conduct():
 @app.route('/user_setup/<int:conduct_id>', methods=['GET', 'POST'])
 def user_setup(conduct_id):
     """Page 5: Identity & Role Selection"""
-    conduct = Conduct.query.get_or_404(conduct_id)
+    conduct = db.get_or_404(Conduct, conduct_id)
     
     # If conduct is inactive, reactivate it when someone joins
     if conduct.status == 'inactive':
-        conduct.status = 'active'
-        conduct.last_activity_at = sg_now()  # Reset the 24-hour timer
-        db.session.commit()
-        print(f"Conduct '{conduct.name}' (PIN: {conduct.pin}) reactivated by user accessing setup")
-        
-        # Log the reactivation
-        try:
-            log_activity(conduct.id, "SYSTEM", 'conduct_reactivated', 
-                       details=f"Conduct reactivated by user accessing setup at {sg_now().strftime('%Y-%m-%d %H:%M:%S')}")
-        except:
-            pass
+        reactivate_conduct(conduct, "user accessing setup")
 
     if request.method == 'POST':
         user_name = request.form.get('user_name', '').strip()
@@ -967,50 +1196,65 @@ def user_setup(conduct_id):
 
         # Validate conducting body password
         if role == 'conducting_body':
-            if conducting_body_password != 'password':  # Default password
+            # Constant-time comparison so response timing does not leak the password
+            if not hmac.compare_digest((conducting_body_password or "").encode(),
+                                       CONDUCTING_BODY_PASSWORD.encode()):
                 flash('Invalid conducting body password', 'error')
                 return render_template('user_setup.html', conduct=conduct)
 
         try:
-            # Check if user already exists in this conduct
-            existing_user = User.query.filter_by(name=user_name, conduct_id=conduct_id).first()
-
-            if existing_user:
-                # Update existing user
-                existing_user.role = role
-                existing_user.status = 'idle' if role == 'trainer' else 'monitoring'
-                db.session.commit()
-                user = existing_user
-            else:
-                # Create new user
-                user = User(
+            # Create the user or update the existing one with the same name in a
+            # single statement; the unique (conduct_id, name) index also stops
+            # two simultaneous joins from creating duplicates
+            status = 'idle' if role == 'trainer' else 'monitoring'
+            if user_upsert_supported:
+                stmt = dialect_insert(User).values(
                     name=user_name,
                     role=role,
                     conduct_id=conduct_id,
-                    status='idle' if role == 'trainer' else 'monitoring'
-                )
-                db.session.add(user)
-                db.session.commit()
+                    status=status
+                ).on_conflict_do_update(
+                    index_elements=['conduct_id', 'name'],
+                    set_={'role': role, 'status': status}
+                ).returning(User)
+                user = db.session.scalars(stmt, execution_options={"populate_existing": True}).one()
+            else:
+                # Without the unique index ON CONFLICT has no target, so look
+                # the user up first
+                user = User.query.filter_by(name=user_name, conduct_id=conduct_id).first()
+                if user:
+                    user.role = role
+                    user.status = status
+                else:
+                    user = User(name=user_name, role=role, conduct_id=conduct_id, status=status)
+                    db.session.add(user)
+                db.session.flush()
 
-            # Update conduct activity when user joins
-            conduct.last_activity_at = sg_now()
+            # Update conduct activity when user joins and log trainer joins,
+            # all in the same transaction
+            now = sg_now()
+            conduct.last_activity_at = now
+            if role == 'trainer':
+                log_activity(conduct_id, user.name, 'user_joined', details=f"Trainer {user.name} joined the conduct",
+                             queued=False, now=now)
+            user_id, payload = user.id, serialize_user(user)
             db.session.commit()
 
             # Store in session
-            session['user_id'] = user.id
+            session['user_id'] = user_id
             session['conduct_id'] = conduct_id
 
             # Emit user update for real-time monitoring (for trainers only)
             if role == 'trainer':
-                emit_user_update(conduct_id, user)
-                # Also log the join activity
-                log_activity(conduct_id, user.name, 'user_joined', details=f"Trainer {user.name} joined the conduct")
+                emit_user_payload(conduct_id, payload)
+                schedule_history_update(conduct_id)
+                mark_join_logged(conduct_id, user_name)
 
             # Redirect based on role
             if role == 'trainer':
-                return redirect(url_for('dashboard', user_id=user.id))
+                return redirect(url_for('dashboard', user_id=user_id))
             else:
-                return redirect(url_for('monitor', user_id=user.id))
+                return redirect(url_for('monitor', user_id=user_id))
 
         except Exception as e:
             db.session.rollback()
@@ -1022,7 +1266,7 @@ def user_setup(conduct_id):
 @app.route('/dashboard/<int:user_id>')
 def dashboard(user_id):
     """Page 6: Trainer Interface"""
-    user = get_cached_user(user_id)
+    user = db.session.get(User, user_id)
     if not user:
         return redirect(url_for('index'))
 
@@ -1031,17 +1275,10 @@ def dashboard(user_id):
 
     system_status = get_conduct_system_status(user.conduct_id)
 
-    # Only log initial join, not page refreshes
-    # Check if this is a fresh session by looking at recent activity
-    recent_activity = ActivityLog.query.filter_by(
-        conduct_id=user.conduct_id,
-        username=user.name,
-        action='user_joined'
-    ).filter(ActivityLog.timestamp >= sg_now() - timedelta(minutes=5)).first()
-    
-    # Only log if no recent join activity (avoid logging every page refresh)
-    if not recent_activity:
+    # Only log initial join, not page refreshes (tracked in the session cookie)
+    if not join_recently_logged(user.conduct_id, user.name):
         log_activity(user.conduct_id, user.name, 'user_joined', details=f"Trainer accessed dashboard")
+        mark_join_logged(user.conduct_id, user.name)
 
     return render_template('dashboard.html', 
                          user=user, 
@@ -1052,16 +1289,22 @@ def dashboard(user_id):
 @app.route('/monitor/<int:user_id>')
 def monitor(user_id):
     """Page 7: Conducting Body Interface"""
-    user = get_cached_user(user_id)
+    # Get all users in this user's conduct in one query (the user is among
+    # them), loading only the columns needed and refusing any lazy relationship load
+    own_conduct = db.session.query(User.conduct_id).filter(User.id == user_id).scalar_subquery()
+    users = User.query.options(
+        load_only(User.id, User.conduct_id, User.name, User.role, User.status, User.zone,
+                  User.start_time, User.end_time, User.location, User.work_completed, User.pending_rest),
+        raiseload('*')
+    ).filter(User.conduct_id == own_conduct).all()
+
+    user = next((u for u in users if u.id == user_id), None)
     if not user:
         return redirect(url_for('index'))
 
     if user.role != 'conducting_body':
         return redirect(url_for('index'))
 
-    # Get all users in this conduct
-    users = User.query.filter_by(conduct_id=user.conduct_id).all()
-
     users_dict = {u.name: {
         'role': u.role,
         'status': u.status,
@@ -1075,17 +1318,10 @@ def monitor(user_id):
 
     system_status = get_conduct_system_status(user.conduct_id)
 
-    # Only log initial join, not page refreshes
-    # Check if this is a fresh session by looking at recent activity
-    recent_activity = ActivityLog.query.filter_by(
-        conduct_id=user.conduct_id,
-        username=user.name,
-        action='user_joined'
-    ).filter(ActivityLog.timestamp >= sg_now() - timedelta(minutes=5)).first()
-    
-    # Only log if no recent join activity (avoid logging every page refresh)
-    if not recent_activity:
+    # Only log initial join, not page refreshes (tracked in the session cookie)
+    if not join_recently_logged(user.conduct_id, user.name):
         log_activity(user.conduct_id, user.name, 'user_joined', details=f"Conducting body accessed monitor")
+        mark_join_logged(user.conduct_id, user.name)
 
     return render_template('monitor.html',
                          users=users_dict,
@@ -1102,19 +1338,19 @@ def monitor(user_id):
 @app.route('/set_zone', methods=['POST'])
 def set_zone():
     """Set WBGT zone for a user"""
-    user_id = request.form.get('user_id')
+    user_id = request.form.get('user_id', type=int)
     target_user_name = request.form.get('target_user')
     zone = request.form.get('zone')
     location = request.form.get('location')
 
     # If no target user specified, use current user
     if not target_user_name:
-        current_user = User.query.get(user_id)
+        current_user = db.session.get(User, user_id)
         if current_user:
             target_user_name = current_user.name
 
     try:
-        user = User.query.get(user_id)
+        user = db.session.get(User, user_id)
         if not user:
             return jsonify({"error": "User not found"}), 404
 
@@ -1134,7 +1370,7 @@ def set_zone():
             current_time = sg_now()
             if cut_off_end.hour < current_time.hour and (current_time.hour - cut_off_end.hour) > 12:
                 cut_off_end_naive = cut_off_end_naive + timedelta(days=1)
-                print(f"Server: Midnight rollover detected for mandatory rest end time: {system_status['cut_off_end_time']} moved to next day")
+                logger.debug("Midnight rollover detected for mandatory rest end time: %s moved to next day", system_status['cut_off_end_time'])
             
             if current_time < cut_off_end_naive and user.role != 'conducting_body':
                 return jsonify({"error": "Mandatory rest period is still active"}), 403
@@ -1156,46 +1392,30 @@ def set_zone():
             return jsonify({"error": "Must start rest cycle before beginning new work cycle"}), 403
 
         # RENDER DEBUG: Log current user state before zone change
-        print(f"RENDER DEBUG: Target user {target_user.name} current state - status: {target_user.status}, zone: {target_user.zone}, end_time: {target_user.end_time}, work_completed: {target_user.work_completed}")
-        
-        # RENDER FIX: Force cache invalidation to ensure fresh data for zone operations
-        invalidate_user_cache(target_user.id)
+        logger.debug("Target user %s current state - status: %s, zone: %s, end_time: %s, work_completed: %s",
+                     target_user.name, target_user.status, target_user.zone, target_user.end_time, target_user.work_completed)
 
         # Set zone and timing with WBGT zone overwrite logic
         now = sg_now()
-        work_duration = WBGT_ZONES.get(zone, {}).get('work', 60)
+        work_duration = ZONE_WORK.get(zone, 60)
         proposed_end = now + timedelta(minutes=work_duration, seconds=0, microseconds=0)
-        print(f"RENDER DEBUG: New zone {zone} requested, work duration: {work_duration} minutes, proposed end: {proposed_end.strftime('%H:%M:%S')}")
+        logger.debug("New zone %s requested, work duration: %s minutes, proposed end: %s", zone, work_duration, proposed_end)
 
         # WBGT zone overwrite logic - if user is currently working, use stricter (earlier) end time
-        if target_user.status == 'working' and target_user.end_time and not target_user.work_completed:
-            print(f"RENDER DEBUG: Zone overwrite triggered for {target_user.name} - current zone: {target_user.zone}, new zone: {zone}")
-            print(f"RENDER DEBUG: Current end time: {target_user.end_time}, proposed new end would be: {(now + timedelta(minutes=work_duration)).strftime('%H:%M:%S')}")
-            
-            current_end_str = target_user.end_time
-            current_end_naive = datetime.strptime(current_end_str, "%H:%M:%S")
-            current_end = now.replace(hour=current_end_naive.hour, minute=current_end_naive.minute, second=current_end_naive.second)
-            
-            # Handle midnight rollover: if end time is earlier than start time,
-            # it means the end time is on the next day
-            if target_user.start_time:
-                start_time_parts = target_user.start_time.split(':')
-                start_hour = int(start_time_parts[0])
-                end_hour = current_end_naive.hour
-                
-                # If end time is significantly earlier than start time, assume next day
-                if end_hour < start_hour and (start_hour - end_hour) > 12:
-                    current_end = current_end + timedelta(days=1)
-                    print(f"RENDER DEBUG: Midnight rollover detected in zone overwrite for {target_user.name}: {current_end_str} moved to next day")
-            
-            # Only use the earlier time if the current end time is in the future
+        if target_user.status == 'working' and target_user.end_time_dt and not target_user.work_completed:
+            logger.debug("Zone overwrite triggered for %s - current zone: %s, new zone: %s", target_user.name, target_user.zone, zone)
+            current_end = target_user.end_time_dt
+
+            # Only use the earlier time if the current end time is in the future;
+            # end_time_dt is absolute, so this holds across midnight
             if current_end > now:
                 proposed_end = min(current_end, proposed_end)
-                print(f"RENDER DEBUG: Zone overwrite applied - using earlier time: {proposed_end.strftime('%H:%M:%S')}")
+                logger.debug("Zone overwrite applied - using earlier time: %s", proposed_end)
             else:
-                print(f"RENDER DEBUG: Zone overwrite NOT applied - current end time is in the past: {current_end} vs now: {now}")
+                logger.debug("Zone overwrite NOT applied - current end time is in the past: %s vs now: %s", current_end, now)
         else:
-            print(f"RENDER DEBUG: Zone overwrite NOT triggered for {target_user.name} - status: {target_user.status}, end_time: {target_user.end_time}, work_completed: {target_user.work_completed}")
+            logger.debug("Zone overwrite NOT triggered for %s - status: %s, end_time: %s, work_completed: %s",
+                         target_user.name, target_user.status, target_user.end_time, target_user.work_completed)
 
         # Strip microseconds for consistent timing across platforms
         now = now.replace(microsecond=0)
@@ -1206,20 +1426,19 @@ def set_zone():
         target_user.zone = zone
         target_user.start_time = now.strftime('%H:%M:%S')
         target_user.end_time = proposed_end.strftime('%H:%M:%S')
+        target_user.end_time_dt = proposed_end
         target_user.work_completed = False
         target_user.pending_rest = False
         
         # Track most stringent zone during work cycle
         target_user.most_stringent_zone = get_most_stringent_zone(zone, target_user.most_stringent_zone)
-        print(f"STRINGENCY DEBUG: User {target_user.name} - Current zone: {zone}, Most stringent: {target_user.most_stringent_zone}")
+        logger.debug("User %s - Current zone: %s, Most stringent: %s", target_user.name, zone, target_user.most_stringent_zone)
         
         if hasattr(target_user, 'location'):
             target_user.location = location
 
         db.session.commit()
-
-        # Invalidate cache
-        invalidate_user_cache(target_user.id)
+        schedule_cycle_check(proposed_end)
 
         # Log activity
         log_activity(conduct_id, target_user.name, 'start_work', zone)
@@ -1243,10 +1462,10 @@ def set_zone():
 @app.route('/toggle_cut_off', methods=['POST'])
 def toggle_cut_off():
     """Toggle cut-off mode for a conduct"""
-    user_id = request.form.get('user_id')
+    user_id = request.form.get('user_id', type=int)
 
     try:
-        user = User.query.get(user_id)
+        user = db.session.get(User, user_id)
         if not user or user.role != 'conducting_body':
             return jsonify({"error": "Unauthorized"}), 401
 
@@ -1254,37 +1473,52 @@ def toggle_cut_off():
         system_status = get_conduct_system_status(conduct_id)
 
         now = sg_now()
+        mandatory_rest_end = None
 
         if system_status["cut_off"]:
             # Deactivate cut-off, start mandatory rest
+            mandatory_rest_end = now + timedelta(minutes=30)
             system_status["cut_off"] = False
-            system_status["cut_off_end_time"] = (now + timedelta(minutes=30)).strftime("%H:%M:%S")
+            system_status["cut_off_end_time"] = mandatory_rest_end.strftime("%H:%M:%S")
 
             # Set all trainers to resting
-            trainers = User.query.filter_by(conduct_id=conduct_id, role='trainer').all()
-            for trainer in trainers:
-                trainer.status = 'resting'
-                trainer.zone = None
-                trainer.start_time = now.strftime("%H:%M:%S")
-                trainer.end_time = (now + timedelta(minutes=30)).strftime("%H:%M:%S")
-                # IMPORTANT: Emit individual user updates for each trainer
-                emit_user_update(conduct_id, trainer)
+            trainer_changes = {
+                'status': 'resting',
+                'zone': None,
+                'start_time': now.strftime("%H:%M:%S"),
+                'end_time': mandatory_rest_end.strftime("%H:%M:%S"),
+                'end_time_dt': mandatory_rest_end
+            }
         else:
             # Activate cut-off
             system_status["cut_off"] = True
             system_status["cut_off_end_time"] = None
 
             # Set all trainers to idle
-            trainers = User.query.filter_by(conduct_id=conduct_id, role='trainer').all()
-            for trainer in trainers:
-                trainer.status = 'idle'
-                trainer.zone = None
-                trainer.start_time = None
-                trainer.end_time = None
-                # IMPORTANT: Emit individual user updates for each trainer
-                emit_user_update(conduct_id, trainer)
+            trainer_changes = {
+                'status': 'idle',
+                'zone': None,
+                'start_time': None,
+                'end_time': None,
+                'end_time_dt': None
+            }
+
+        # Update every trainer in one statement, returning what the emits need
+        trainers = db.session.execute(
+            update(User)
+            .where(User.conduct_id == conduct_id, User.role == 'trainer')
+            .values(**trainer_changes)
+            .returning(User.id, User.name, User.status, User.zone, User.start_time, User.end_time,
+                       User.work_completed, User.pending_rest, User.role)
+        ).all()
 
         db.session.commit()
+        save_conduct_system_status(conduct_id, system_status)
+        if mandatory_rest_end:
+            schedule_cycle_check(mandatory_rest_end)
+
+        # IMPORTANT: Emit every trainer's update in one event
+        emit_users_bulk_update(conduct_id, [serialize_user(trainer) for trainer in trainers])
 
         # CRITICAL: Emit system status update to ALL clients in conduct room
         emit_system_status_update(conduct_id, system_status)
@@ -1299,26 +1533,23 @@ def toggle_cut_off():
 @app.route('/stop_cycle', methods=['POST'])
 def stop_cycle():
     """Stop current cycle early"""
-    user_id = request.form.get('user_id')
+    user_id = request.form.get('user_id', type=int)
 
     try:
-        user = User.query.get(user_id)
+        # Stop current cycle in a single UPDATE, returning what the log and emit need
+        user = db.session.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(status='idle', zone=None, start_time=None, end_time=None, end_time_dt=None,
+                    work_completed=False, pending_rest=False)
+            .returning(User.id, User.name, User.conduct_id, User.status, User.zone, User.start_time,
+                       User.end_time, User.work_completed, User.pending_rest, User.role)
+        ).one_or_none()
         if not user:
             return jsonify({"error": "User not found"}), 404
 
-        # Stop current cycle
-        user.status = 'idle'
-        user.zone = None
-        user.start_time = None
-        user.end_time = None
-        user.work_completed = False
-        user.pending_rest = False
-
         db.session.commit()
 
-        # Invalidate cache
-        invalidate_user_cache(user.id)
-
         # Log activity
         log_activity(user.conduct_id, user.name, 'early_completion')
 
@@ -1339,7 +1570,7 @@ def start_rest():
     username = data.get('username')
 
     try:
-        user = User.query.filter_by(name=username).first()
+        user = db.session.query(User).filter_by(name=username).first()
         if not user:
             return jsonify({"error": "User not found"}), 404
 
@@ -1349,7 +1580,8 @@ def start_rest():
         # Use most stringent zone for rest duration calculation
         zone_for_rest = user.most_stringent_zone or user.zone
         rest_duration = get_rest_duration_for_most_stringent_zone(zone_for_rest)
-        print(f"STRINGENCY DEBUG: User {user.name} - Current zone: {user.zone}, Most stringent: {user.most_stringent_zone}, Rest duration: {rest_duration} min")
+        logger.debug("User %s - Current zone: %s, Most stringent: %s, Rest duration: %s min",
+                     user.name, user.zone, user.most_stringent_zone, rest_duration)
 
         # Handle test cycle differently (seconds vs minutes)
         if user.zone == 'test':
@@ -1364,18 +1596,17 @@ def start_rest():
         user.status = 'resting'
         user.start_time = start_time_str
         user.end_time = end_time_str
+        user.end_time_dt = end_time
         
         # Reset most stringent zone tracker after starting rest
         user.most_stringent_zone = None
         
-        print(f"TIMING DEBUG: Rest start - Now: {now}, End: {end_time}, Duration: {rest_duration}min")
+        logger.debug("Rest start - Now: %s, End: %s, Duration: %smin", now, end_time, rest_duration)
         user.work_completed = False
         user.pending_rest = False
 
         db.session.commit()
-
-        # Invalidate cache
-        invalidate_user_cache(user.id)
+        schedule_cycle_check(end_time)
 
         # Log activity with enhanced details showing stringent zone logic
         if zone_for_rest == 'test':
@@ -1407,7 +1638,12 @@ def start_rest():
 def get_user_state(username):
     """Get current state of a user"""
     try:
-        user = User.query.filter_by(name=username).first()
+        # Load only the returned columns; any other attribute access raises
+        user = db.session.query(User).options(
+            load_only(User.status, User.zone, User.most_stringent_zone, User.start_time,
+                      User.end_time, User.work_completed, User.pending_rest),
+            raiseload('*')
+        ).filter_by(name=username).first()
         if not user:
             return jsonify({"error": "User not found"}), 404
 
@@ -1428,10 +1664,10 @@ def get_user_state(username):
 @app.route('/clear_commands', methods=['POST'])
 def clear_commands():
     """Clear all commands and reset all trainer interfaces in the conduct"""
-    user_id = request.form.get('user_id')
+    user_id = request.form.get('user_id', type=int)
 
     try:
-        user = User.query.get(user_id)
+        user = db.session.get(User, user_id)
         if not user:
             return jsonify({"error": "User not found"}), 404
 
@@ -1440,26 +1676,40 @@ def clear_commands():
 
         conduct_id = user.conduct_id
 
-        # Reset all trainers in this conduct to initial idle state
-        trainers = User.query.filter_by(conduct_id=conduct_id, role='trainer').all()
-
-        for trainer in trainers:
-            trainer.status = 'idle'
-            trainer.zone = None
-            trainer.start_time = None
-            trainer.end_time = None
-            trainer.work_completed = False
-            trainer.pending_rest = False
-            trainer.most_stringent_zone = None  # Reset stringent zone tracker
-
-            # Invalidate cache
-            invalidate_user_cache(trainer.id)
-
-            # Log activity
-            log_activity(conduct_id, trainer.name, 'interface_reset', details="Trainer interface reset by conducting body")
+        # Reset trainers in this conduct to initial idle state in one UPDATE,
+        # returning what the logs and emits need. Trainers already fully reset
+        # are skipped, so they get no log or emit.
+        trainers = db.session.execute(
+            update(User)
+            .where(User.conduct_id == conduct_id, User.role == 'trainer',
+                   or_(User.status != 'idle', User.zone.isnot(None), User.start_time.isnot(None),
+                       User.end_time.isnot(None), User.end_time_dt.isnot(None),
+                       User.work_completed.is_(True), User.pending_rest.is_(True),
+                       User.most_stringent_zone.isnot(None)))
+            .values(status='idle', zone=None, start_time=None, end_time=None, end_time_dt=None,
+                    work_completed=False, pending_rest=False,
+                    most_stringent_zone=None)  # Reset stringent zone tracker
+            .returning(User.id, User.name, User.status, User.zone, User.start_time, User.end_time,
+                       User.work_completed, User.pending_rest, User.role)
+        ).all()
+
+        # Log activity for every reset trainer with a single executemany insert
+        now = sg_now()
+        if trainers:
+            reset_logs = [dict(
+                conduct_id=conduct_id,
+                username=trainer.name,
+                action='interface_reset',
+                zone=None,
+                details="Trainer interface reset by conducting body",
+                timestamp=now
+            ) for trainer in trainers]
+            db.session.execute(ActivityLog.__table__.insert(), reset_logs)
+            queue_history_entries(conduct_id, reset_logs)
 
-            # CRITICAL: Emit user update to all clients in conduct room
-            emit_user_update(conduct_id, trainer)
+        # Log conducting body activity
+        log_activity(conduct_id, user.name, 'clear_commands', details="All commands cleared and trainer interfaces reset",
+                     queued=False, now=now)
 
         # Reset system status
         system_status = get_conduct_system_status(conduct_id)
@@ -1467,12 +1717,14 @@ def clear_commands():
         system_status["cut_off_end_time"] = None
 
         db.session.commit()
+        save_conduct_system_status(conduct_id, system_status)
+
+        # CRITICAL: Emit every reset trainer's update to the conduct room in one event
+        emit_users_bulk_update(conduct_id, [serialize_user(trainer) for trainer in trainers])
 
         # Emit system status update
         emit_system_status_update(conduct_id, system_status)
-
-        # Log conducting body activity
-        log_activity(conduct_id, user.name, 'clear_commands', details="All commands cleared and trainer interfaces reset")
+        schedule_history_update(conduct_id)
 
         return jsonify({"success": True, "message": "All commands cleared and trainer interfaces reset successfully"})
 
@@ -1484,27 +1736,45 @@ def clear_commands():
 @app.route('/get_server_time')
 def get_server_time():
     """Get current server time for synchronization"""
-    # Return UTC timestamp for proper client synchronization
-    return jsonify({"timestamp": datetime.utcnow().timestamp()})
+    # Epoch seconds straight from time.time(); datetime.utcnow().timestamp()
+    # read the naive UTC time as local time and drifted on non-UTC hosts
+    body = b'{"timestamp":' + f'{time.time():.3f}'.encode() + b'}'
+    return app.response_class(body, mimetype='application/json')
 
 @app.route('/get_system_status')
 def get_system_status():
     """Get current system status"""
-    # For now return empty status, but in full implementation this would get the actual status
-    return jsonify({"cut_off": False, "cut_off_end_time": None})
+    conduct_id = request.args.get('conduct_id', type=int)
+    if conduct_id is None:
+        return jsonify({"cut_off": False, "cut_off_end_time": None})
+    return jsonify(get_conduct_system_status(conduct_id))
+
+# Resting users listed individually by the rest completion debug endpoint
+DEBUG_RESTING_LIMIT = 50
 
 @app.route('/api/debug_rest_completion/<int:conduct_id>')
 def debug_rest_completion(conduct_id):
     """Debug endpoint to check rest completion status"""
     try:
-        # Get all resting users in this conduct
-        resting_users = User.query.filter_by(conduct_id=conduct_id, status='resting').all()
-        
         now = sg_now()
         current_time_str = now.strftime('%H:%M:%S')
+
+        # Count overdue and pending rests in the database
+        counts = db.session.query(
+            func.count().filter(User.end_time_dt <= now).label('overdue'),
+            func.count().filter(User.end_time_dt > now).label('pending')
+        ).filter(User.conduct_id == conduct_id, User.status == 'resting').one()
+
+        # List the resting users closest to completion
+        resting_users = db.session.query(User.name, User.zone, User.start_time, User.end_time, User.end_time_dt)\
+                                  .filter_by(conduct_id=conduct_id, status='resting')\
+                                  .order_by(User.end_time_dt)\
+                                  .limit(DEBUG_RESTING_LIMIT).all()
         
         debug_info = {
             'current_time': current_time_str,
+            'overdue_count': counts.overdue,
+            'pending_count': counts.pending,
             'resting_users': [],
             'activity_logs': []
         }
@@ -1518,25 +1788,19 @@ def debug_rest_completion(conduct_id):
                 'should_complete': False
             }
             
-            if user.end_time:
-                # Parse end time
-                end_time_parts = user.end_time.split(':')
-                end_time = now.replace(
-                    hour=int(end_time_parts[0]),
-                    minute=int(end_time_parts[1]),
-                    second=int(end_time_parts[2]) if len(end_time_parts) > 2 else 0,
-                    microsecond=0
-                )
-                
+            if user.end_time_dt:
+                end_time = user.end_time_dt
                 user_info['should_complete'] = now >= end_time
                 user_info['time_until_completion'] = str(end_time - now) if now < end_time else 'OVERDUE'
             
             debug_info['resting_users'].append(user_info)
         
         # Get recent activity logs
-        recent_logs = ActivityLog.query.filter_by(conduct_id=conduct_id)\
-                                     .order_by(ActivityLog.timestamp.desc())\
-                                     .limit(10).all()
+        recent_logs = db.session.query(ActivityLog.timestamp, ActivityLog.username, ActivityLog.action,
+                                       ActivityLog.zone, ActivityLog.details)\
+                                .filter_by(conduct_id=conduct_id)\
+                                .order_by(ActivityLog.timestamp.desc())\
+                                .limit(10).all()
         
         debug_info['activity_logs'] = [{
             'timestamp': log.timestamp.isoformat(),
@@ -1551,17 +1815,43 @@ def debug_rest_completion(conduct_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Page size bounds for the paginated activity history endpoint
+HISTORY_PAGE_DEFAULT = 50
+HISTORY_PAGE_MAX = 200
+
 @app.route('/check_activity_history/<int:conduct_id>')
 def check_activity_history(conduct_id):
-    """Check recent activity history for debugging"""
+    """Check recent activity history for debugging, newest first, one page at a time"""
+    limit = max(1, min(request.args.get('limit', HISTORY_PAGE_DEFAULT, type=int), HISTORY_PAGE_MAX))
+    cursor = request.args.get('cursor')  # next_cursor from the previous page
+
     try:
-        recent_logs = ActivityLog.query.filter_by(conduct_id=conduct_id)\
-                                     .order_by(ActivityLog.timestamp.desc())\
-                                     .all()
-        
+        query = db.session.query(ActivityLog.id, ActivityLog.timestamp, ActivityLog.username,
+                                 ActivityLog.action, ActivityLog.zone, ActivityLog.details)\
+                          .filter(ActivityLog.conduct_id == conduct_id)
+
+        # Keyset pagination on (timestamp, id) so pages stay cheap however deep
+        # they go and rows sharing a timestamp are neither skipped nor repeated
+        if cursor:
+            try:
+                cursor_ts, cursor_id = cursor.rsplit(',', 1)
+                cursor_key = (datetime.fromisoformat(cursor_ts), int(cursor_id))
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            query = query.filter(tuple_(ActivityLog.timestamp, ActivityLog.id) < cursor_key)
+
+        recent_logs = query.order_by(ActivityLog.timestamp.desc(), ActivityLog.id.desc())\
+                           .limit(limit).all()
+
+        next_cursor = None
+        if len(recent_logs) == limit:
+            last = recent_logs[-1]
+            next_cursor = f"{last.timestamp.isoformat()},{last.id}"
+
         return jsonify({
             'conduct_id': conduct_id,
             'total_logs': len(recent_logs),
+            'next_cursor': next_cursor,
             'recent_activity': [{
                 'id': log.id,
                 'timestamp': log.timestamp.isoformat(),
@@ -1575,11 +1865,11 @@ def check_activity_history(conduct_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/force_rest_completion/<username>')
-def force_rest_completion(username):
-    """Force rest completion for testing on Render deployment"""
+def _complete_rest(username, result_message):
+    """End a user's rest cycle manually: log it, reset the user and notify the conduct"""
     try:
-        user = User.query.filter_by(name=username).first()
+        user = db.session.query(User.id, User.conduct_id, User.name, User.zone, User.status)\
+                         .filter_by(name=username).first()
         if not user:
             return jsonify({"error": "User not found"}), 404
             
@@ -1589,48 +1879,40 @@ def force_rest_completion(username):
         now = sg_now()
         current_time_str = now.strftime('%H:%M:%S')
         
-        print(f"FORCE REST COMPLETION: Triggering for {username}")
-        
-        # Store zone and conduct info before clearing for logging
+        # Store zone and conduct info for logging and the emits below
         completed_zone = user.zone
         conduct_id = user.conduct_id
         user_name = user.name
         
-        # Log completion BEFORE resetting user data - Enhanced for Render debugging
+        # Insert the log and reset the user in one transaction, without loading the user
         try:
-            # RENDER PRODUCTION FIX: Create activity log directly for better control
-            activity_log = ActivityLog(
+            completion_log = dict(
                 conduct_id=conduct_id,
                 username=user_name,
                 action='completed_rest',
                 zone=completed_zone,
                 details=f"Rest cycle completed manually at {current_time_str}",
-                timestamp=sg_now()
+                timestamp=now
             )
-            
-            db.session.add(activity_log)
-            db.session.flush()  # Ensure log is created
-            print(f"FORCE RENDER DEBUG: Activity log created for {user_name}: completed_rest in {completed_zone}")
-            
-            # Reset user data
-            user.status = 'idle'
-            user.zone = None
-            user.start_time = None
-            user.end_time = None
-            user.work_completed = False
-            user.pending_rest = False
-            
-            # Commit BOTH activity log and user changes together
+            db.session.execute(ActivityLog.__table__.insert(), [completion_log])
+            queue_history_entries(conduct_id, [completion_log])
+
+            user = db.session.execute(
+                update(User)
+                .where(User.id == user.id)
+                .values(status='idle', zone=None, start_time=None, end_time=None, end_time_dt=None,
+                        work_completed=False, pending_rest=False)
+                .returning(User.id, User.name, User.status, User.zone, User.start_time,
+                           User.end_time, User.work_completed, User.pending_rest, User.role)
+            ).one()
+
             db.session.commit()
-            print(f"FORCE RENDER DEBUG: Combined database commit successful for {user_name}")
             
         except Exception as combined_error:
-            print(f"FORCE RENDER DEBUG: Error in combined transaction: {combined_error}")
+            logging.error(f"Error completing rest for {user_name}: {combined_error}")
             db.session.rollback()
             return jsonify({"error": f"Database transaction failed: {combined_error}"}), 500
         
-        invalidate_user_cache(user.id)
-        
         # Emit user update
         emit_user_update(conduct_id, user)
         
@@ -1639,26 +1921,29 @@ def force_rest_completion(username):
             'user': user_name,
             'zone': completed_zone,
             'action': 'rest_cycle_completed'
-        }, room=f'conduct_{conduct_id}')
+        }, room=conduct_room(conduct_id))
         
         # Force immediate history refresh for monitors
-        socketio.emit('history_update', {
-            'history': get_recent_history(conduct_id)
-        }, room=f'conduct_{conduct_id}')
+        schedule_history_update(conduct_id)
         
-        print(f"FORCE: Rest completion processed successfully for {user_name} in zone {completed_zone}")
+        logger.info("Rest completion processed manually for %s in zone %s", user_name, completed_zone)
         
         return jsonify({
             "success": True,
-            "message": f"Rest completion forced for {username}",
+            "message": f"{result_message} for {username}",
             "previous_zone": completed_zone,
             "new_status": user.status
         })
         
     except Exception as e:
-        print(f"FORCE: Error in manual rest completion: {e}")
+        logging.error(f"Error in manual rest completion: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/force_rest_completion/<username>')
+def force_rest_completion(username):
+    """Force rest completion for testing on Render deployment"""
+    return _complete_rest(username, "Rest completion forced")
+
 @app.route('/get_conduct_history/<int:conduct_id>')
 def get_conduct_history(conduct_id):
     """Get activity history for a specific conduct"""
@@ -1703,94 +1988,22 @@ def test_activity_log(conduct_id):
         })
         
     except Exception as e:
-        print(f"TEST LOG ERROR: {e}")
+        logging.error(f"Error in activity log test: {e}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/test_rest_completion/<username>')
 def test_rest_completion(username):
     """Test endpoint to manually trigger rest completion for debugging"""
-    try:
-        user = User.query.filter_by(name=username).first()
-        if not user:
-            return jsonify({"error": "User not found"}), 404
-            
-        if user.status != 'resting':
-            return jsonify({"error": f"User {username} is not in resting state. Current status: {user.status}"}), 400
-            
-        now = sg_now()
-        current_time_str = now.strftime('%H:%M:%S')
-        
-        print(f"MANUAL TEST: Triggering rest completion for {username}")
-        print(f"User status before: {user.status}, zone: {user.zone}, end_time: {user.end_time}")
-        
-        # Store zone and conduct info before clearing for logging
-        completed_zone = user.zone
-        conduct_id = user.conduct_id
-        user_name = user.name
-        
-        # Log completion BEFORE resetting user data
-        try:
-            log_activity(conduct_id, user_name, 'completed_rest', completed_zone, 
-                        f"Rest cycle completed manually at {current_time_str}")
-            print(f"MANUAL TEST: Activity logged for {user_name}: completed_rest in {completed_zone}")
-        except Exception as log_error:
-            print(f"MANUAL TEST: Error logging rest completion: {log_error}")
-        
-        # Reset user data
-        user.status = 'idle'
-        user.zone = None
-        user.start_time = None
-        user.end_time = None
-        user.work_completed = False
-        user.pending_rest = False
-        
-        # Commit database changes
-        try:
-            db.session.commit()
-            print(f"MANUAL TEST: Database committed for {user_name} rest completion")
-        except Exception as commit_error:
-            print(f"MANUAL TEST: Database commit error: {commit_error}")
-            db.session.rollback()
-            return jsonify({"error": f"Database commit failed: {commit_error}"}), 500
-        
-        invalidate_user_cache(user.id)
-        
-        # Emit user update
-        emit_user_update(conduct_id, user)
-        
-        # Emit specific event for zone button re-enabling
-        socketio.emit('rest_cycle_completed', {
-            'user': user_name,
-            'zone': completed_zone,
-            'action': 'rest_cycle_completed'
-        }, room=f'conduct_{conduct_id}')
-        
-        # Force immediate history refresh for monitors
-        socketio.emit('history_update', {
-            'history': get_recent_history(conduct_id)
-        }, room=f'conduct_{conduct_id}')
-        
-        print(f"MANUAL TEST: Rest completion processed successfully for {user_name} in zone {completed_zone}")
-        
-        return jsonify({
-            "success": True,
-            "message": f"Rest completion triggered for {username}",
-            "previous_zone": completed_zone,
-            "new_status": user.status
-        })
-        
-    except Exception as e:
-        print(f"MANUAL TEST: Error in manual rest completion: {e}")
-        return jsonify({"error": str(e)}), 500
+    return _complete_rest(username, "Rest completion triggered")
 
 @app.route('/remove_user', methods=['POST'])
 def remove_user():
     """Remove a user from the conduct"""
-    user_id = request.form.get('user_id')
+    user_id = request.form.get('user_id', type=int)
     target_user_name = request.form.get('target_user')
 
     try:
-        user = User.query.get(user_id)
+        user = db.session.get(User, user_id)
         if not user:
             return jsonify({"error": "User not found"}), 404
 
@@ -1800,7 +2013,7 @@ def remove_user():
         conduct_id = user.conduct_id
 
         # Find target user
-        target_user = User.query.filter_by(name=target_user_name, conduct_id=conduct_id).first()
+        target_user = db.session.query(User).filter_by(name=target_user_name, conduct_id=conduct_id).first()
         if not target_user:
             return jsonify({"error": "Target user not found"}), 404
 
@@ -1814,13 +2027,13 @@ def remove_user():
         db.session.delete(target_user)
         db.session.commit()
 
-        # Invalidate cache
-        invalidate_user_cache(target_user.id)
+        # Forget the last payload sent so a re-joining user is announced again
+        _last_user_state.get(conduct_id, {}).pop(target_user_name, None)
 
         # Emit user removal update to all clients in conduct room
         socketio.emit('user_removed', {
             'user': target_user_name
-        }, room=f'conduct_{conduct_id}')
+        }, room=conduct_room(conduct_id))
 
         return jsonify({"success": True, "message": f"User {target_user_name} removed successfully"})
 
@@ -1833,21 +2046,21 @@ def remove_user():
 def force_work_completion_check(username):
     """Manually trigger work completion check for a user"""
     try:
-        user = User.query.filter_by(name=username).first()
+        user = db.session.query(User).filter_by(name=username).first()
         if not user:
             return jsonify({"error": "User not found"}), 404
 
         if user.work_completed and user.pending_rest and user.zone:
             # Show work complete modal
-            show_work_complete_modal(user.name, user.zone)
+            show_work_complete_modal(user.name, user.zone, user.conduct_id)
             
             # Emit work cycle completed event
             socketio.emit('work_cycle_completed', {
                 'username': user.name,
                 'zone': user.zone,
-                'rest_time': WBGT_ZONES.get(user.zone, {}).get('rest', 15),
+                'rest_time': ZONE_REST.get(user.zone, 15),
                 'action': 'work_cycle_completed'
-            }, room=f'conduct_{user.conduct_id}')
+            }, room=user_room(user.name, user.conduct_id))
             
             return jsonify({"success": True, "message": "Work completion notification sent"})
         else:
@@ -1862,7 +2075,7 @@ def force_work_completion_check(username):
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection"""
-    print(f'Client connected: {request.sid}')
+    logger.debug("Client connected: %s", request.sid)
     # Start background task when first client connects
     global background_task_started
     if not background_task_started:
@@ -1872,31 +2085,46 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
-    print(f'Client disconnected: {request.sid}')
+    logger.debug("Client disconnected: %s", request.sid)
 
 @socketio.on('join_conduct')
 def handle_join_conduct(data):
     """Join a conduct room for real-time updates"""
     conduct_id = data.get('conduct_id')
     if conduct_id:
-        join_room(f'conduct_{conduct_id}')
-        print(f'Client {request.sid} joined conduct room: {conduct_id}')
+        join_room(conduct_room(conduct_id))
+        logger.debug("Client %s joined conduct room: %s", request.sid, conduct_id)
+
+        # Trainers also join a personal room for notifications meant only for them
+        username = data.get('username')
+        if username:
+            join_room(user_room(username, conduct_id))
 
         # Send current system status immediately when joining
         system_status = get_conduct_system_status(conduct_id)
         emit('system_status_update', system_status)
 
+@socketio.on('join_user_room')
+def handle_join_user_room(data):
+    """Join only a trainer's personal room, for sockets that need their notifications but not conduct-wide events"""
+    conduct_id = data.get('conduct_id')
+    username = data.get('username')
+    if conduct_id and username:
+        join_room(user_room(username, conduct_id))
+        logger.debug("Client %s joined user room: %s in %s", request.sid, username, conduct_id)
+
 @socketio.on('leave_conduct')
 def handle_leave_conduct(data):
     """Leave a conduct room"""
     conduct_id = data.get('conduct_id')
     if conduct_id:
-        leave_room(f'conduct_{conduct_id}')
-        print(f'Client {request.sid} left conduct room: {conduct_id}')
+        leave_room(conduct_room(conduct_id))
+        logger.debug("Client %s left conduct room: %s", request.sid, conduct_id)
 
 @app.route('/change_password', methods=['GET', 'POST'])
 def change_password():
     """Change password for battalion or company"""
+    # POST results are flashed and redirected back here, so only GET renders
     if request.method == 'POST':
         password_type = request.form.get('password_type')
         
@@ -1909,33 +2137,32 @@ def change_password():
             # Validation
             if not all([battalion_name, current_password, new_password, confirm_password]):
                 flash('All fields are required.', 'error')
-                return render_template('change_password.html')
+                return redirect(url_for('change_password'))
             
             if new_password != confirm_password:
                 flash('New passwords do not match.', 'error')
-                return render_template('change_password.html')
+                return redirect(url_for('change_password'))
             
             if len(new_password) < 6:
                 flash('Password must be at least 6 characters long.', 'error')
-                return render_template('change_password.html')
+                return redirect(url_for('change_password'))
             
             # Find battalion (case sensitive)
             battalion = Battalion.query.filter_by(name=battalion_name).first()
-            if not battalion:
-                flash('Battalion not found.', 'error')
-                return render_template('change_password.html')
             
-            # Verify current password
-            if not battalion.check_password(current_password):
-                flash('Current password is incorrect.', 'error')
-                return render_template('change_password.html')
+            # Verify current password; an unknown battalion gets the same message
+            authenticated = (battalion.check_password(current_password) if battalion
+                             else check_missing_password(current_password))
+            if not authenticated:
+                flash('Invalid battalion name or password.', 'error')
+                return redirect(url_for('change_password'))
             
             # Update password
             battalion.set_password(new_password)
             db.session.commit()
             
             flash(f'Battalion password for {battalion.name.title()} updated successfully!', 'success')
-            return render_template('change_password.html')
+            return redirect(url_for('change_password'))
             
         elif password_type == 'company':
             battalion_name = request.form.get('company_battalion_name', '').strip()
@@ -1947,62 +2174,93 @@ def change_password():
             # Validation
             if not all([battalion_name, company_name, current_password, new_password, confirm_password]):
                 flash('All fields are required.', 'error')
-                return render_template('change_password.html')
+                return redirect(url_for('change_password'))
             
             if new_password != confirm_password:
                 flash('New passwords do not match.', 'error')
-                return render_template('change_password.html')
+                return redirect(url_for('change_password'))
             
             if len(new_password) < 6:
                 flash('Password must be at least 6 characters long.', 'error')
-                return render_template('change_password.html')
+                return redirect(url_for('change_password'))
             
-            # Find battalion first (case sensitive)
-            battalion = Battalion.query.filter_by(name=battalion_name).first()
-            if not battalion:
-                flash('Battalion not found.', 'error')
-                return render_template('change_password.html')
-            
-            # Find company within the battalion (case sensitive)
-            company = Company.query.filter_by(
-                name=company_name, 
-                battalion_id=battalion.id
+            # Find the company within the battalion in one query (case sensitive)
+            company = Company.query.join(Battalion).filter(
+                Battalion.name == battalion_name,
+                Company.name == company_name
             ).first()
-            if not company:
-                flash(f'Company {company_name} not found in {battalion_name} Battalion.', 'error')
-                return render_template('change_password.html')
             
-            # Verify current password
-            if not company.check_password(current_password):
-                flash('Current password is incorrect.', 'error')
-                return render_template('change_password.html')
+            # Verify current password; an unknown battalion or company gets the same message
+            authenticated = (company.check_password(current_password) if company
+                             else check_missing_password(current_password))
+            if not authenticated:
+                flash('Invalid battalion name, company name or password.', 'error')
+                return redirect(url_for('change_password'))
             
             # Update password
             company.set_password(new_password)
             db.session.commit()
             
             flash(f'Company password for {company.name.title()} Company updated successfully!', 'success')
-            return render_template('change_password.html')
+            return redirect(url_for('change_password'))
     
     return render_template('change_password.html')
 
-# Schedule work completion checks every 5 seconds
+def seed_cycle_deadlines():
+    """Rebuild the deadline heap from cycles already running in the database"""
+    with app.app_context():
+        try:
+            end_times = db.session.scalars(
+                db.select(User.end_time_dt).where(
+                    User.status.in_(['working', 'resting']),
+                    User.end_time_dt.isnot(None)
+                )
+            ).all()
+            cycle_deadlines.extend(end_times)
+            heapq.heapify(cycle_deadlines)
+            cycle_deadline_added.set()
+        except Exception as e:
+            logging.error(f"Error seeding cycle deadlines: {e}")
+
+# Schedule work completion checks at each cycle's end time
 def start_background_tasks():
     """Start background tasks"""
     def run_checks():
-        conduct_check_counter = 0
+        seed_cycle_deadlines()
+        next_sweep = time.monotonic() + CYCLE_SWEEP_INTERVAL
         while True:
-            eventlet.sleep(1)  # Check every 1 second for responsive completion detection
-            check_user_cycles()
-            
-            # Check conduct activity every 60 seconds (1 minute)
-            conduct_check_counter += 1
-            if conduct_check_counter >= 60:
-                check_conduct_activity()
-                conduct_check_counter = 0
-
-    eventlet.spawn(run_checks)
-    print("Background task started for work cycle monitoring (1-second intervals) and conduct activity checking (1-minute intervals)")
+            # Sleep until the earliest cycle deadline, a newly scheduled one, or the next sweep
+            timeout = max(0, next_sweep - time.monotonic())
+            if cycle_deadlines:
+                timeout = min(timeout, max(0, (cycle_deadlines[0] - sg_now()).total_seconds()))
+            cycle_deadline_added.wait(timeout)
+            cycle_deadline_added.clear()
+
+            now = sg_now()
+            due = False
+            while cycle_deadlines and cycle_deadlines[0] <= now:
+                heapq.heappop(cycle_deadlines)
+                due = True
+
+            if time.monotonic() >= next_sweep:
+                # Fallback sweep catches cycles scheduled by other worker processes
+                run_exclusive('cycles', check_user_cycles)
+                next_sweep = time.monotonic() + CYCLE_SWEEP_INTERVAL
+            elif due and not run_exclusive('cycles', check_user_cycles):
+                # Another worker is mid-check and may have queried before this deadline
+                schedule_cycle_check(now + timedelta(seconds=1))
+
+    def run_activity_checks():
+        while True:
+            socketio.sleep(CONDUCT_ACTIVITY_INTERVAL)
+            # Lock is left to expire so the check runs once per interval across workers
+            run_exclusive('conduct_activity', check_conduct_activity,
+                          ttl=CONDUCT_ACTIVITY_INTERVAL - 5, release=False)
+
+    socketio.start_background_task(run_checks)
+    socketio.start_background_task(run_activity_checks)
+    socketio.start_background_task(write_activity_logs)
+    print("Background task started for work cycle monitoring (deadline-driven) and conduct activity checking (1-minute intervals)")
 
 # Add cleanup handler
 @app.teardown_appcontext
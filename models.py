@@ -10,6 +10,15 @@ class Base(DeclarativeBase):
 
 db = SQLAlchemy(model_class=Base)
 
+# Checked when no account matches, so a missing name costs as much hashing
+# time as a wrong password
+MISSING_ACCOUNT_HASH = generate_password_hash('missing-account')
+
+def check_missing_password(password):
+    """Run a password check for an account that does not exist; always fails"""
+    check_password_hash(MISSING_ACCOUNT_HASH, password)
+    return False
+
 class Battalion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), unique=True, nullable=False)
@@ -30,7 +39,7 @@ class Battalion(db.Model):
 
 class Company(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    battalion_id = db.Column(db.Integer, db.ForeignKey('battalion.id'), nullable=False)
+    battalion_id = db.Column(db.Integer, db.ForeignKey('battalion.id'), nullable=False, index=True)
     name = db.Column(db.String(200), nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -50,6 +59,10 @@ class Company(db.Model):
     def __repr__(self):
         return f'<Company {self.name}>'
 
+# Case-insensitive name lookups compare lower(name), so index that expression
+db.Index('ix_battalion_lower_name', db.func.lower(Battalion.name))
+db.Index('ix_company_battalion_lower_name', Company.battalion_id, db.func.lower(Company.name))
+
 # Keep Unit model for backward compatibility but mark as deprecated
 class Unit(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -79,9 +92,16 @@ class Conduct(db.Model):
     last_activity_at = db.Column(db.DateTime, default=datetime.utcnow)  # For 24-hour deactivation logic
     status = db.Column(db.String(20), default='active')  # active, inactive
 
+    __table_args__ = (
+        # Serves the periodic inactive-conduct check
+        db.Index('ix_conduct_status_activity', 'status', 'last_activity_at'),
+        # Serves loading and counting a company's conducts by status
+        db.Index('ix_conduct_company_status', 'company_id', 'status'),
+    )
+
     # Relationship
-    users = db.relationship('User', backref='conduct', lazy=True, cascade='all, delete-orphan')
-    sessions = db.relationship('Session', backref='conduct', lazy=True, cascade='all, delete-orphan')
+    users = db.relationship('User', backref='conduct', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    sessions = db.relationship('Session', backref='conduct', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
 
     def generate_pin(self):
         """Generate a unique 6-digit PIN"""
@@ -98,7 +118,7 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     role = db.Column(db.String(20), nullable=False)  # trainer, conducting_body
-    conduct_id = db.Column(db.Integer, db.ForeignKey('conduct.id'), nullable=False)
+    conduct_id = db.Column(db.Integer, db.ForeignKey('conduct.id', ondelete='CASCADE'), nullable=False)
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Current session data (for active users)
@@ -106,11 +126,24 @@ class User(db.Model):
     zone = db.Column(db.String(20))
     start_time = db.Column(db.String(10))
     end_time = db.Column(db.String(10))
+    end_time_dt = db.Column(db.DateTime, index=True)  # Absolute end of current cycle, used for completion checks
     location = db.Column(db.String(200))
     work_completed = db.Column(db.Boolean, default=False)
     pending_rest = db.Column(db.Boolean, default=False)
     most_stringent_zone = db.Column(db.String(20))  # Track harshest zone during current cycle
 
+    __table_args__ = (
+        # Serves per-conduct lookups filtered by user status
+        db.Index('ix_user_conduct_status', 'conduct_id', 'status'),
+        # One user per name in a conduct; also the conflict target for joins
+        db.Index('uq_user_conduct_name', 'conduct_id', 'name', unique=True),
+        # Serves the per-conduct trainer resets in cut-off and clear commands
+        db.Index('ix_user_conduct_role', 'conduct_id', 'role'),
+        # Serves the username-only lookups (user state, start rest, debug
+        # completions); not unique, since names repeat across conducts
+        db.Index('ix_user_name', 'name'),
+    )
+
     # Relationship
     sessions = db.relationship('Session', backref='user', lazy=True, cascade='all, delete-orphan')
 
@@ -120,7 +153,7 @@ class User(db.Model):
 class Session(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    conduct_id = db.Column(db.Integer, db.ForeignKey('conduct.id'), nullable=False)
+    conduct_id = db.Column(db.Integer, db.ForeignKey('conduct.id', ondelete='CASCADE'), nullable=False, index=True)
     zone = db.Column(db.String(20))
     start_time = db.Column(db.DateTime)
     end_time = db.Column(db.DateTime)
@@ -134,12 +167,15 @@ class Session(db.Model):
 
 class ActivityLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    conduct_id = db.Column(db.Integer, db.ForeignKey('conduct.id'), nullable=False)
+    conduct_id = db.Column(db.Integer, db.ForeignKey('conduct.id', ondelete='CASCADE'), nullable=False)
     username = db.Column(db.String(100), nullable=False)
     action = db.Column(db.String(50), nullable=False)
     zone = db.Column(db.String(20))
     details = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, nullable=False)  # Remove default, will be set explicitly
 
+    # Serves the per-conduct history query (filter by conduct, newest first)
+    __table_args__ = (db.Index('ix_activity_conduct_ts', 'conduct_id', 'timestamp'),)
+
     def __repr__(self):
         return f'<ActivityLog {self.username} - {self.action}>'
\ No newline at end of file
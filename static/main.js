@@ -59,6 +59,11 @@ document.addEventListener('DOMContentLoaded', async function() {
     // Socket.io connection handlers
     socketio.on('connect', function() {
       console.log('Socket.io connected successfully');
+      // Join only the personal room that receives work complete notifications;
+      // the conduct room would run the update handlers below for every trainer's events
+      if (window.conductId && window.currentUser) {
+        socketio.emit('join_user_room', { conduct_id: window.conductId, username: window.currentUser });
+      }
       fetchSystemStatus();
       updateDashboard();
       if (pollingInterval) {
@@ -110,12 +115,13 @@ document.addEventListener('DOMContentLoaded', async function() {
 
     // Handle history updates
     socketio.on('history_update', function(data) {
-      updateHistoryTable(data.history || []);
+      const entries = data.entries || [];
+      prependHistoryEntries(entries);
 
       // Check if current user started rest cycle and clear reminders
-      if (data.history && window.currentUser) {
-        const latestEntry = data.history[data.history.length - 1];
-        if (latestEntry && latestEntry.username === window.currentUser && latestEntry.action === 'start_rest') {
+      if (window.currentUser) {
+        const startedRest = entries.some(entry => entry.username === window.currentUser && entry.action === 'start_rest');
+        if (startedRest) {
           console.log('User started rest cycle, clearing reminders');
           if (typeof clearRestReminders === 'function') {
             clearRestReminders();
@@ -134,6 +140,12 @@ document.addEventListener('DOMContentLoaded', async function() {
       checkZoneRestrictions();
     });
 
+    socketio.on('users_bulk_update', function(data) {
+      console.log('Bulk user update received:', data);
+      updateDashboard();
+      checkZoneRestrictions();
+    });
+
     // Handle rest cycle completion
     socketio.on('rest_cycle_completed', function(data) {
       if (data.user === window.currentUser) {
@@ -539,9 +551,15 @@ function parseTimeString(timeStr, isEndTime = false, startTime = null) {
   return date;
 }
 
+// System status URL for the current conduct; without conduct_id the server returns a stub
+function systemStatusUrl() {
+  const query = window.conductId ? `?conduct_id=${encodeURIComponent(window.conductId)}` : '';
+  return `/get_system_status${query}`;
+}
+
 // Fetch system status via AJAX
 function fetchSystemStatus() {
-  return fetch('/get_system_status')
+  return fetch(systemStatusUrl())
     .then(response => response.json())
     .then(data => {
       console.log("Fetched system status:", data);
@@ -571,16 +589,17 @@ function stopPolling() {
 }
 
 // Update history table with latest data
-function updateHistoryTable(history) {
-  if (!history || !history.length) return;
+// Rows kept in the history table; matches the server's recent history limit
+const HISTORY_TABLE_LIMIT = 200;
+
+// Add new entries (newest first) to the top of the history table
+function prependHistoryEntries(entries) {
+  if (!entries || !entries.length) return;
 
   const historyTbody = document.querySelector('#history-table tbody');
   if (!historyTbody) return;
 
-  // Show all entries (unlimited history)
-  const latestEntries = history.slice().reverse();
-
-  historyTbody.innerHTML = latestEntries.map(entry => `
+  historyTbody.insertAdjacentHTML('afterbegin', entries.map(entry => `
     <tr>
       <td class="px-4 py-3 text-sm">${entry.timestamp}</td>
       <td class="px-4 py-3 text-sm">${entry.username}</td>
@@ -593,7 +612,11 @@ function updateHistoryTable(history) {
         entry.action === 'early_completion' ? 'Cycle ended early by user' : ''
       }</td>
     </tr>
-  `).join('');
+  `).join(''));
+
+  while (historyTbody.rows.length > HISTORY_TABLE_LIMIT) {
+    historyTbody.deleteRow(-1);
+  }
 }
 
 // Admin functions for WBGT system control
@@ -764,7 +787,7 @@ function checkZoneRestrictions() {
       };
 
       // Check system status
-      fetch('/get_system_status')
+      fetch(systemStatusUrl())
         .then(response => response.json())
         .then(systemStatus => {
           restrictions.systemCutOff = systemStatus.cut_off;
@@ -507,11 +507,16 @@ const workModal = new WorkCompletionModal();
 
 // Listen for rest cycle completion to re-enable zone buttons
 if (typeof socket !== 'undefined') {
-    socket.on('user_update', function(data) {
+    function clearNotificationsIfIdle(data) {
         if (data.user === window.currentUser && data.status === 'idle' && !data.work_completed && !data.pending_rest) {
             // Rest cycle completed or user reset to idle
             workModal.clearAllNotifications();
         }
+    }
+
+    socket.on('user_update', clearNotificationsIfIdle);
+    socket.on('users_bulk_update', function(data) {
+        data.users.forEach(clearNotificationsIfIdle);
     });
 }
 